@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Laufzeit- und Speichermessung der Konvertierung mit synthetischen Daten:
+#
+#     python -m benchmark --elemente 20000 --signale 300 --ls-vertices 8
+#
+# Die Zeiten werden ohne Speicherverfolgung gemessen (bester von
+# --wiederholungen Läufen), der Spitzenspeicher in einem zusätzlichen Lauf
+# mit tracemalloc.
+
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import generator
+
+
+def messen(funktion, wiederholungen, vorbereiten):
+    zeiten = []
+    for _ in range(wiederholungen):
+        vorbereiten()
+        start = time.perf_counter()
+        funktion()
+        zeiten.append(time.perf_counter() - start)
+
+    vorbereiten()
+    tracemalloc.start()
+    try:
+        funktion()
+        _, spitze = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(zeiten), spitze
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="Misst Laufzeit und Speicherbedarf der Konvertierung anhand synthetischer Zusi-2-Daten.",
+    )
+    gruppe = parser.add_argument_group("Strecke")
+    gruppe.add_argument(
+        "--elemente", type=int, default=5000, help="ungefähre Zahl der Streckenelemente"
+    )
+    gruppe.add_argument(
+        "--weichen",
+        type=float,
+        default=0.02,
+        help="Anteil der Elemente mit Überleitung auf ein Nebengleis",
+    )
+    gruppe.add_argument(
+        "--signale", type=int, default=100, help="ungefähre Zahl der Signale"
+    )
+    gruppe.add_argument("--gleise", type=int, default=2, help="Gleise je Bahnhof")
+    gruppe.add_argument(
+        "--matrix-zeilen",
+        type=int,
+        default=0,
+        help="zusätzliche Fahrziele je Signalmatrix",
+    )
+    gruppe.add_argument(
+        "--matrix-spalten",
+        type=int,
+        default=5,
+        help="Geschwindigkeitsspalten je Signalmatrix",
+    )
+    gruppe = parser.add_argument_group("Landschaft")
+    gruppe.add_argument(
+        "--ls-elemente", type=int, default=1000, help="Elemente je ls-Datei"
+    )
+    gruppe.add_argument(
+        "--ls-vertices", type=int, default=4, help="Vertices je Element"
+    )
+    gruppe.add_argument(
+        "--ls-tiefe",
+        type=int,
+        default=2,
+        help="Tiefe der Verknüpfungen zwischen ls-Dateien",
+    )
+    gruppe = parser.add_argument_group("Fahrplan")
+    gruppe.add_argument("--zuege", type=int, default=20, help="Zahl der Züge")
+    gruppe.add_argument("--halte", type=int, default=5, help="Halte je Zug")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Prozesse für conv_str (Standard: 1)"
+    )
+    parser.add_argument(
+        "--wiederholungen", type=int, default=3, help="Läufe je Messung (Standard: 3)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--ziel",
+        help="Verzeichnis für die erzeugten Daten (Standard: temporär, wird gelöscht)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Ausgaben der Konvertierung anzeigen",
+    )
+    args = parser.parse_args()
+
+    ziel = args.ziel or tempfile.mkdtemp(prefix="z2bench")
+    try:
+        z2 = os.path.join(ziel, "zusi2")
+        z3 = os.path.join(ziel, "zusi3")
+        basis = r"Strecken\Benchmark"
+
+        print(f"Erzeuge Testdaten in {ziel}", file=sys.stderr)
+        ls_name, anzahl_vertices = generator.landschaft(
+            z2, basis, args.ls_elemente, args.ls_vertices, args.ls_tiefe, seed=args.seed
+        )
+        str_name, bahnhoefe, anzahl_elemente, anzahl_signale = generator.strecke(
+            z2,
+            basis,
+            elemente=args.elemente,
+            weichen=args.weichen,
+            signale=args.signale,
+            gleise=args.gleise,
+            matrix_zeilen=args.matrix_zeilen,
+            matrix_spalten=args.matrix_spalten,
+            ls_name=ls_name,
+            seed=args.seed,
+        )
+        fpn_name = generator.fahrplan(
+            z2, basis, bahnhoefe, args.zuege, args.halte, args.gleise
+        )
+
+        # Die Konverter lesen die Datenverzeichnisse beim Import.
+        os.environ["ZUSI2_DATAPATH"] = z2
+        os.environ["ZUSI3_DATAPATH"] = z3
+        from zusi2to3 import common, fahrplan, landschaft, strecke
+
+        str_abs = common.z2rel_to_abs(str_name)
+        fpn_abs = common.z2rel_to_abs(fpn_name)
+        os.makedirs(
+            os.path.dirname(common.z3rel_to_abs(common.z2rel_to_z3rel(fpn_name))),
+            exist_ok=True,
+        )
+        st3_name, rekursionstiefe = "", 0
+
+        def conv_str():
+            nonlocal st3_name, rekursionstiefe
+            st3_name, rekursionstiefe = strecke.conv_str(str_abs, jobs=args.jobs)
+
+        def groesse(name):
+            return os.path.getsize(common.z2rel_to_abs(name))
+
+        ls_verzeichnis = os.path.dirname(common.z2rel_to_abs(ls_name))
+        ls_groesse = sum(
+            os.path.getsize(os.path.join(ls_verzeichnis, datei))
+            for datei in os.listdir(ls_verzeichnis)
+        )
+
+        messungen = [
+            (
+                "conv_ls",
+                lambda: landschaft.conv_ls(ls_name),
+                anzahl_vertices,
+                "Vertices",
+                ls_groesse,
+            ),
+            ("conv_str", conv_str, anzahl_elemente, "Elemente", groesse(str_name)),
+            (
+                "conv_fpn",
+                lambda: fahrplan.conv_fpn(fpn_abs, st3_name, rekursionstiefe),
+                args.zuege,
+                "Züge",
+                groesse(fpn_name),
+            ),
+        ]
+
+        print(
+            f"Strecke: {anzahl_elemente} Elemente, {anzahl_signale} Signale, "
+            f"{len(bahnhoefe)} Bahnhöfe; Landschaft: {anzahl_vertices} Vertices; "
+            f"Fahrplan: {args.zuege} Züge"
+        )
+        for name, funktion, menge, einheit, eingabe in messungen:
+            with contextlib.ExitStack() as stack:
+                if not args.verbose:
+                    devnull = stack.enter_context(open(os.devnull, "w"))
+                    stack.enter_context(contextlib.redirect_stderr(devnull))
+                dauer, spitze = messen(
+                    funktion, args.wiederholungen, landschaft.conv_ls_cache_clear
+                )
+            print(
+                f"{name:<9} {dauer:8.3f} s  {menge / dauer:12.0f} {einheit}/s  "
+                f"{eingabe / dauer / 1e6:7.2f} MB/s  Spitze {spitze / 1e6:7.1f} MB"
+            )
+    finally:
+        if not args.ziel:
+            shutil.rmtree(ziel, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
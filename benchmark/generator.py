@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Erzeugt synthetische Zusi-2-Daten (Strecke, Landschaft, Fahrplan) für die
+# Laufzeitmessungen. Alle Pfade innerhalb der Dateien sind relativ zum
+# Zusi-2-Datenverzeichnis und mit Backslash getrennt, wie bei Zusi üblich.
+
+import ntpath
+import os
+import random
+
+
+def fl(x):
+    return str(x).replace(".", ",")
+
+
+def schreiben(z2, name, zeilen):
+    pfad = os.path.join(z2, name.replace("\\", os.sep))
+    os.makedirs(os.path.dirname(pfad), exist_ok=True)
+    with open(pfad, "w", encoding="iso-8859-1", newline="") as f:
+        f.write("\r\n".join(str(z) for z in zeilen) + "\r\n")
+    return pfad
+
+
+# Eine ls-Datei mit anzahl_elemente Elementen zu je anzahl_vertices Vertices.
+# verknuepfungen: [(Dateiname, x, y, z, rx, ry, rz)]
+def ls_datei(z2, name, anzahl_elemente, anzahl_vertices, verknuepfungen=(), seed=0):
+    rnd = random.Random(seed)
+    zeilen = ["2.3", anzahl_elemente]
+    for datei, x, y, z, rx, ry, rz in verknuepfungen:
+        zeilen += [datei, fl(x), fl(y), fl(z), fl(rx), fl(ry), fl(rz)]
+    zeilen.append("#")
+    for i in range(anzahl_elemente):
+        if i % 7 == 3:
+            # Lichtquelle
+            zeilen += [0] + ["0"] * 11
+            continue
+        zeilen += [anzahl_vertices, "#"]
+        for _ in range(anzahl_vertices):
+            zeilen += [
+                fl(round(rnd.uniform(-50, 50), 3)),
+                fl(round(rnd.uniform(-50, 50), 3)),
+                fl(round(rnd.uniform(0, 10), 3)),
+            ]
+        zeilen += [rnd.randint(0, 1000), rnd.randint(0, 1000)]
+        zeilen += [fl(0.5) if i % 5 == 0 else "0", "#", rnd.randint(0, 3), "#", "#"]
+    schreiben(z2, name, zeilen)
+    return name
+
+
+# Landschaft als Kette verknüpfter ls-Dateien der Tiefe tiefe. Jede Ebene
+# verknüpft zusätzlich eine gemeinsame Blattdatei, damit auch mehrfach
+# verknüpfte Dateien vorkommen. Liefert den Namen der obersten Datei und die
+# Gesamtzahl der Vertices.
+def landschaft(z2, basis, anzahl_elemente, anzahl_vertices, tiefe, seed=0):
+    blatt = ls_datei(
+        z2, rf"{basis}\Landschaft\blatt.ls", anzahl_elemente, anzahl_vertices, seed=seed
+    )
+    darunter = []
+    for ebene in range(tiefe, -1, -1):
+        name = rf"{basis}\Landschaft\land{ebene}.ls"
+        verknuepfungen = [(blatt, 40 * ebene, -20, 0, 0, 0, 0.1 * ebene)]
+        verknuepfungen += [(d, 100, 50, 1, 0.1, 0.2, 0.3) for d in darunter]
+        ls_datei(
+            z2,
+            name,
+            anzahl_elemente,
+            anzahl_vertices,
+            verknuepfungen,
+            seed=seed + ebene,
+        )
+        darunter = [name]
+
+    # Lichtquellen haben keine Vertices
+    mit_vertices = sum(1 for i in range(anzahl_elemente) if i % 7 != 3)
+    return name, (tiefe + 2) * mit_vertices * anzahl_vertices
+
+
+class _Gleisplan:
+    def __init__(self, rnd, weichen):
+        self.rnd = rnd
+        self.weichen = weichen
+        self.elemente = {}
+
+    def neu(self, **eigenschaften):
+        nr = len(self.elemente) + 1
+        element = {"succ": [], "sig": None, "fs": False, "reg": 0, "er": 0}
+        element.update(eigenschaften)
+        self.elemente[nr] = element
+        return nr
+
+    def verbinden(self, von, nach):
+        self.elemente[von]["succ"].append(nach)
+
+    # Kette von n Gleiselementen. Mit Wahrscheinlichkeit weichen zweigt an
+    # einem Element ein Nebengleis ab, das drei Elemente weiter wieder
+    # einmündet (Überleitung ohne Signale).
+    def kette(self, start, n):
+        aktuell = start
+        i = 0
+        while i < n:
+            x = self.neu()
+            self.verbinden(aktuell, x)
+            aktuell = x
+            i += 1
+            if i + 3 <= n and self.rnd.random() < self.weichen:
+                m1 = self.neu()
+                self.verbinden(aktuell, m1)
+                seite1 = self.neu()
+                self.verbinden(aktuell, seite1)
+                m2 = self.neu()
+                self.verbinden(m1, m2)
+                seite2 = self.neu()
+                self.verbinden(seite1, seite2)
+                aktuell = self.neu()
+                self.verbinden(m2, aktuell)
+                self.verbinden(seite2, aktuell)
+                i += 3
+        return aktuell
+
+    # Verzweigung auf n Gleise; ein Element hat höchstens drei Nachfolger.
+    def faecher(self, quelle, n):
+        if n <= 1:
+            a = self.neu()
+            self.verbinden(quelle, a)
+            return [a]
+        k = n // 2
+        ergebnis = []
+        for teil in (k, n - k):
+            a = self.neu()
+            self.verbinden(quelle, a)
+            ergebnis += [a] if teil == 1 else self.faecher(a, teil)
+        return ergebnis
+
+
+# Strecke aus einer Folge von Bahnhöfen mit je einem Vorsignal, einem
+# Einfahrsignal, gleise Ausfahrsignalen und einem Blocksignal. Die Zahl der
+# Bahnhöfe ergibt sich aus signale, die Länge der freien Strecke aus elemente.
+# Jede Signalmatrix erhält matrix_zeilen zusätzliche Fahrziele (ohne passendes
+# Zielsignal) und matrix_spalten Geschwindigkeitsspalten.
+# Liefert den Dateinamen, die Namen der Bahnhöfe und die Zahl der Elemente
+# und Signale.
+def strecke(
+    z2,
+    basis,
+    elemente=5000,
+    weichen=0.02,
+    signale=100,
+    gleise=2,
+    matrix_zeilen=0,
+    matrix_spalten=5,
+    ls_name=None,
+    seed=1,
+):
+    rnd = random.Random(seed)
+    plan = _Gleisplan(rnd, weichen)
+    ls_datei(z2, rf"{basis}\Signale\hp.ls", 5, 4, seed=seed + 1)
+    ls_datei(z2, rf"{basis}\Signale\vr.ls", 3, 4, seed=seed + 2)
+    ls_datei(
+        z2,
+        rf"{basis}\Signale\fs.ls",
+        2,
+        3,
+        [(rf"{basis}\Signale\vr.ls", 1, 1, 0, 0, 0, 0)],
+        seed=seed + 3,
+    )
+    if ls_name is None:
+        ls_name = ls_datei(z2, rf"{basis}\Landschaft\land.ls", 10, 3, seed=seed + 4)
+
+    anzahl_bahnhoefe = max(1, round(signale / (gleise + 3)))
+    fest = 20 + 6 * gleise  # Elemente je Bahnhof außerhalb der freien Strecke
+    laenge = max(1, (elemente // anzahl_bahnhoefe - fest) // 3)
+
+    erstes = plan.neu()
+    aufgleispunkte = [erstes]
+    aktuell = plan.kette(erstes, 3)
+    regnr = 100
+    bahnhoefe = []
+    for b in range(anzahl_bahnhoefe):
+        bst = f"Bf{b}"
+        vorsignal = plan.neu(sig={"anonym": True})
+        plan.verbinden(aktuell, vorsignal)
+        aktuell = plan.kette(vorsignal, laenge)
+        einfahrt = plan.neu(
+            sig={"block": bst, "gleis": "A", "bf": b, "art": "einfahrt"}
+        )
+        plan.verbinden(aktuell, einfahrt)
+        weiche = plan.kette(einfahrt, 2)
+        plan.elemente[weiche]["reg"] = regnr
+        regnr += 1
+        ausfahrten = []
+        enden = []
+        for t, anfang in enumerate(plan.faecher(weiche, gleise)):
+            ende = plan.kette(anfang, 2 + t % 3)
+            if t == 1:
+                plan.elemente[ende]["fs"] = True
+            ausfahrt = plan.neu(
+                sig={"block": bst, "gleis": str(t + 1), "bf": b, "art": "ausfahrt"}
+            )
+            plan.verbinden(ende, ausfahrt)
+            ende = plan.kette(ausfahrt, 2)
+            plan.elemente[ende]["er"] = 3002
+            if t == 0:
+                plan.elemente[ende]["reg"] = regnr
+                regnr += 1
+            ausfahrten.append(ausfahrt)
+            enden.append(ende)
+        zusammen = plan.neu()
+        for ende in enden:
+            plan.verbinden(ende, zusammen)
+        aktuell = plan.kette(zusammen, laenge)
+        block = plan.neu(
+            sig={"block": f"Blk{b}", "gleis": "1", "bf": b, "art": "block"}
+        )
+        plan.verbinden(aktuell, block)
+        aktuell = plan.kette(block, laenge)
+        bahnhoefe.append((vorsignal, einfahrt, ausfahrten))
+    endsignal = plan.neu(sig={"block": "Ende", "gleis": "1", "art": "ende"})
+    plan.verbinden(aktuell, endsignal)
+    letztes = plan.kette(endsignal, 2)
+    plan.elemente[letztes]["er"] = 3002
+    aufgleispunkte.append(bahnhoefe[len(bahnhoefe) // 2][2][0])
+
+    spalten = [0, -1] + [40 + 20 * k for k in range(max(0, matrix_spalten - 2))]
+    spalten = spalten[: max(1, matrix_spalten)]
+
+    def matrix(sig):
+        art = sig["art"]
+        b = sig.get("bf")
+        zeilen = [("", "", 0)]
+        if art == "einfahrt":
+            zeilen += [(f"Bf{b}", str(t + 1), 40) for t in range(gleise)]
+        elif art == "ausfahrt":
+            zeilen += [(f"Blk{b}", "1", 80)]
+        elif art == "block":
+            if b + 1 < anzahl_bahnhoefe:
+                zeilen += [(f"Bf{b + 1}", "A", 0 if b % 2 == 0 else 100)]
+            else:
+                zeilen += [("Ende", "1", 100)]
+        zeilen += [(f"Fern{k}", "1", 60) for k in range(matrix_zeilen)]
+        return zeilen
+
+    zeilen = ["2.3", "Autor", "x", "5", "Beschreibung", "#", "#", "y", ls_name]
+    for i, element in enumerate(aufgleispunkte):
+        zeilen += [i + 1, element, f"Aufgleispunkt {i}"]
+    zeilen += ["#", "x", "#"]
+    anzahl_signale = 0
+    for nr, element in plan.elemente.items():
+        zeilen += [nr, fl(1000.5 + nr), "+", "Land", element["er"]]
+        zeilen += [fl(nr * 1.5), fl(2.25), fl(0.5), fl(nr * 1.5 + 1.5), fl(2.25)]
+        zeilen += [fl(0.5), fl(-0.01)]
+        zeilen += element["succ"] + [0] * (3 - len(element["succ"]))
+        zeilen += [fl(120), "a", "b", "c", "d"]
+        if element["fs"]:
+            zeilen += [fl(1.5), fl(2.5), fl(3.5), fl(0.1), fl(0.2), fl(0.3)] + ["0"] * 6
+            zeilen += [rf"{basis}\Signale\fs.ls", "0"]
+            if nr % 2:
+                zeilen += [rf"{basis}\Signale\hp.ls", "0", rf"{basis}\Signale\vr.ls"]
+                zeilen += ["0", "#"]
+            else:
+                zeilen += ["#"]
+            zeilen += [0, "x", 0]
+        else:
+            zeilen.append("#")
+        sig = element["sig"]
+        if sig:
+            anzahl_signale += 1
+            zeilen += [fl(1.0), fl(2.0), fl(3.0), fl(0.0), fl(0.0), fl(1.5)]
+            if nr % 3:
+                zeilen += [fl(0.0)] * 6
+            else:
+                zeilen += [fl(5.0), fl(6.0), fl(7.0), fl(0.1), fl(0.2), fl(0.3)]
+            if sig.get("anonym"):
+                zeilen += [rf"{basis}\Signale\vr.ls", "1", "#", "", ""]
+                mzeilen = [("", "", 0)]
+            else:
+                zeilen += [rf"{basis}\Signale\hp.ls", "1", rf"{basis}\Signale\vr.ls"]
+                zeilen += ["2", "#", sig["block"], sig["gleis"]]
+                mzeilen = matrix(sig)
+            zeilen += [len(mzeilen) - 1, len(spalten) - 1]
+            for block, gleis, v in mzeilen:
+                zeilen += [block, gleis, v, "#", "#"]
+            zeilen += spalten
+            zeilen.append("0")
+            for i, (block, gleis, v) in enumerate(mzeilen):
+                for j, s in enumerate(spalten):
+                    vm = 0 if v == 0 else (min(v, s) if s > 0 else v)
+                    if j == 0 and sig.get("art") == "block" and sig["bf"] % 2 == 0:
+                        vm = 0
+                    zeilen += [i * 10 + j, vm, j % 2, 0, 0, "#"]
+            zeilen += [0, 0, 0, 0, 0, "#", "0"]
+            if sig.get("art") == "einfahrt":
+                zeilen.append(bahnhoefe[sig["bf"]][0])
+            if sig.get("art") == "ausfahrt" and sig["bf"] > 0:
+                zeilen.append(bahnhoefe[sig["bf"]][1])
+            zeilen += ["#", "r"]
+        else:
+            zeilen.append("#")
+        zeilen.append(element["reg"])
+
+    name = rf"{basis}\{ntpath.basename(basis)}.str"
+    schreiben(z2, name, zeilen)
+    bahnhofsnamen = [f"Bf{b}" for b in range(anzahl_bahnhoefe)]
+    return name, bahnhofsnamen, len(plan.elemente), anzahl_signale
+
+
+# Fahrplan mit anzahl_zuege Zügen, die jeweils halte Bahnhöfe anfahren.
+# Liefert den Dateinamen des Fahrplans.
+def fahrplan(z2, basis, bahnhoefe, anzahl_zuege=20, halte=5, gleise=2):
+    verzeichnis = rf"{basis}\Fahrplan"
+    zuege = []
+    for z in range(anzahl_zuege):
+        zeilen = ["2.3", str(1000 + z), "RB", "P", "1", "-1" if z % 2 else "0", "x"]
+        zeilen += ["120", "x", "Lok.fzg", "a", "b", "#IF", "2", "e", "t", "r", "r"]
+        zeilen += ["z", f"Zuglauf {z}", "tuer"] + ["r"] * 6
+        for k in range(halte):
+            bst = bahnhoefe[(z + k) % len(bahnhoefe)]
+            zeilen += [bst, "08:00:00", "08:01:00", str(1 + (z + k) % gleise), "#"]
+            zeilen += ["#", "x"]
+        zeilen += ["#IF"] + ["f"] * 3
+        schreiben(z2, rf"{verzeichnis}\Zug{z}.zug", zeilen)
+        zuege.append(f"Zug{z}.zug")
+    name = rf"{verzeichnis}\{ntpath.basename(basis)}.fpn"
+    schreiben(z2, name, ["2.3", "08:00:00"] + zuege)
+    return name
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Die Konverter lesen die Datenverzeichnisse beim Import. Die Tests setzen ihre
+# eigenen Verzeichnisse über common.Z2ABS und common.Z3ABS bzw. die Umgebung der
+# gestarteten Prozesse.
+os.environ.setdefault("ZUSI2_DATAPATH", tempfile.gettempdir())
+os.environ.setdefault("ZUSI3_DATAPATH", tempfile.gettempdir())
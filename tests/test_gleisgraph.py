@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from zusi2to3.gleisgraph import KREIS, SIGNAL, Gleisgraph
+
+
+# elemente: [(Elementnummer, [Nachfolger], flags)]
+def _graph(elemente):
+    graph = Gleisgraph()
+    for nr, succ, flags in elemente:
+        graph.add(nr, succ, flags)
+    graph.finish()
+    return graph
+
+
+def test_finish_indizes_und_vorgaenger():
+    graph = Gleisgraph()
+    graph.add(10, [20, 30])
+    graph.add(20, [40])
+    graph.add(30, [40])
+    graph.add(40, [])
+    assert graph.finish() == [3]
+    assert list(graph.succs(0)) == [1, 2]
+    assert list(graph.preds(3)) == [1, 2]
+    assert list(graph.preds(0)) == []
+
+
+def test_finish_fehlender_nachfolger():
+    graph = Gleisgraph()
+    graph.add(1, [2])
+    with pytest.raises(ValueError):
+        graph.finish()
+
+
+def test_kreise_ohne_signal():
+    # 1 -> 2 -> 3 -> 1 ist ein Kreis, 4 hängt nur daran.
+    graph = _graph([(1, [2], 0), (2, [3], 0), (3, [1, 4], 0), (4, [], 0)])
+    assert graph.kreise() == [[0, 1, 2]]
+    assert [bool(f & KREIS) for f in graph.flags] == [True, True, True, False]
+
+
+def test_kreise_mit_hauptsignal():
+    graph = _graph([(1, [2], 0), (2, [3], SIGNAL), (3, [1], 0)])
+    assert graph.kreise() == []
+    assert not any(f & KREIS for f in graph.flags)
+
+
+def test_kreise_schleife_und_einzelelement():
+    graph = _graph([(1, [1], 0), (2, [3], 0), (3, [], 0)])
+    assert graph.kreise() == [[0]]
+
+
+def test_kreise_mehrere_komponenten():
+    # Zwei Kreise, durch eine Verbindung in nur einer Richtung getrennt.
+    graph = _graph([(1, [2], 0), (2, [1, 3], 0), (3, [4], 0), (4, [5], 0), (5, [3], 0)])
+    assert sorted(graph.kreise()) == [[0, 1], [2, 3, 4]]
+
+
+def test_kreise_lang():
+    # Iterativ: auch sehr lange Kreise überschreiten keine Rekursionsgrenze.
+    n = 100000
+    graph = _graph([(i, [(i + 1) % n], 0) for i in range(n)])
+    assert graph.kreise() == [list(range(n))]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from zusi2to3 import common, stapel
+
+
+@pytest.fixture
+def z2(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, "Z2ABS", str(tmp_path))
+    return tmp_path
+
+
+def _datei(z2, name):
+    pfad = z2 / name
+    pfad.parent.mkdir(parents=True, exist_ok=True)
+    pfad.write_bytes(b"")
+    return os.path.normpath(pfad)
+
+
+def test_finden_verzeichnis(z2):
+    strname = _datei(z2, "Strecken/A/A.str")
+    fpn_a = _datei(z2, "Strecken/A/Fahrplan/A.fpn")
+    fpn_b = _datei(z2, "Strecken/A/Fahrplan/Sonder/B.FPN")
+    leer = _datei(z2, "Strecken/Leer/Leer.str")
+    doppelt = _datei(z2, "Strecken/D/D.fpn")
+    _datei(z2, "Strecken/D/a.str")
+    _datei(z2, "Strecken/D/b.str")
+    ohne = _datei(z2, "Fahrplaene/X.fpn")
+
+    strecken, ohne_strecke = stapel.finden(str(z2))
+
+    assert strecken[strname] == [fpn_a, fpn_b]
+    assert strecken[leer] == []
+    assert set(ohne_strecke) == {doppelt, ohne}
+    assert "nicht eindeutig" in ohne_strecke[doppelt]
+    assert ohne_strecke[ohne] == "keine Streckendatei gefunden"
+
+
+def test_finden_liste(z2):
+    strname = _datei(z2, "Strecken/A/A.str")
+    fpn_a = _datei(z2, "Strecken/A/Fahrplan/A.fpn")
+    _datei(z2, "Strecken/A/Fahrplan/Nicht.fpn")
+    fpn_b = _datei(z2, "Strecken/B/B.fpn")
+    strname_b = _datei(z2, "Strecken/B/B.str")
+    liste = z2 / "liste.txt"
+    liste.write_text(
+        "# Kommentar\n"
+        "\n"
+        "Strecken\\A\\A.str\n"
+        "Strecken\\A\\Fahrplan\\A.fpn\n"
+        f"{fpn_b}\n"
+        # doppelt genannte Fahrpläne werden nur einmal zugeordnet
+        "Strecken\\A\\Fahrplan\\A.fpn\n",
+        encoding="utf-8",
+    )
+
+    strecken, ohne_strecke = stapel.finden(str(liste))
+
+    assert strecken == {strname: [fpn_a], strname_b: [fpn_b]}
+    assert ohne_strecke == {}
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Ein zweiter Lauf über unveränderte Daten muss alles aus dem Manifest
+# übernehmen und darf keine Ausgabedatei neu schreiben.
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import generator
+from zusi2to3 import common, manifest
+
+ZUSI2TO3 = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "zusi2to3.py"
+)
+BASIS = r"Strecken\Benchmark"
+
+
+@pytest.fixture
+def daten(tmp_path):
+    z2 = str(tmp_path / "zusi2")
+    z3 = str(tmp_path / "zusi3")
+    ls_name, _ = generator.landschaft(z2, BASIS, 20, 3, 1)
+    str_name, bahnhoefe, _, _ = generator.strecke(
+        z2, BASIS, elemente=400, signale=15, ls_name=ls_name
+    )
+    fpn_name = generator.fahrplan(z2, BASIS, bahnhoefe, anzahl_zuege=8, halte=3)
+    return z2, z3, str_name, fpn_name
+
+
+def _konvertieren(z2, z3, argumente):
+    umgebung = dict(os.environ, ZUSI2_DATAPATH=z2, ZUSI3_DATAPATH=z3)
+    lauf = subprocess.run(
+        [sys.executable, ZUSI2TO3, *argumente],
+        env=umgebung,
+        capture_output=True,
+        text=True,
+    )
+    assert lauf.returncode == 0, lauf.stderr
+    return lauf.stderr
+
+
+# {Pfad: mtime} aller Dateien unter z3
+def _ausgaben(z3):
+    return {
+        os.path.join(verzeichnis, dateiname): os.stat(
+            os.path.join(verzeichnis, dateiname)
+        ).st_mtime_ns
+        for verzeichnis, _, dateinamen in os.walk(z3)
+        for dateiname in dateinamen
+    }
+
+
+@pytest.mark.parametrize(
+    "optionen",
+    [[], ["-j", "2"], ["-j", "2", "--trn-files"], ["--batch"]],
+    ids=["seriell", "parallel", "trn-dateien", "stapel"],
+)
+def test_zweiter_lauf_uebernimmt_alles(daten, optionen, monkeypatch):
+    z2, z3, str_name, fpn_name = daten
+    if optionen == ["--batch"]:
+        argumente = ["--batch", z2]
+    else:
+        argumente = optionen + [
+            os.path.join(z2, str_name.replace("\\", os.sep)),
+            os.path.join(z2, fpn_name.replace("\\", os.sep)),
+        ]
+
+    _konvertieren(z2, z3, argumente)
+    vorher = _ausgaben(z3)
+    _konvertieren(z2, z3, argumente)
+
+    # Nichts neu geschrieben, auch nicht das Manifest.
+    assert _ausgaben(z3) == vorher
+
+    monkeypatch.setattr(common, "Z3ABS", z3)
+    monkeypatch.setattr(manifest, "_eintraege", None)
+    monkeypatch.setattr(manifest, "_geaendert", False)
+    manifest.load()
+    arten = {schluessel.split(":", 1)[0] for schluessel in manifest._eintraege}
+    assert {"ls", "str", "fpn"} <= arten
+    for schluessel in manifest._eintraege:
+        art, rest = schluessel.split(":", 1)
+        assert manifest.lookup(art, rest) is not None, schluessel
@@ -1,10 +1,159 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import sys
 
-from zusi2to3 import strecke, fahrplan
+from zusi2to3 import common, strecke, fahrplan, landschaft, manifest
+from zusi2to3 import profil, protokoll, stapel
 
-(st3_name, rekursionstiefe) = strecke.conv_str(sys.argv[1])
-for fpnname in sys.argv[2:]:
-    fahrplan.conv_fpn(fpnname, st3_name, rekursionstiefe)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Konvertiert eine Zusi-2-Strecke und ihre Fahrpläne nach Zusi 3."
+    )
+    parser.add_argument("strname", nargs="?", help="Zusi-2-Streckendatei (.str)")
+    parser.add_argument("fpnnames", nargs="*", help="Zusi-2-Fahrpläne (.fpn)")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="alle Dateien neu konvertieren, auch wenn sie sich laut Manifest nicht geändert haben",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Anzahl der Prozesse für die Fahrstraßensuche und die Fahrpläne, mit --batch für die Strecken (Standard: 1)",
+    )
+    grenzen = strecke.Suchgrenzen()
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=grenzen.max_tiefe,
+        help=f"höchstens so viele Streckenelemente je Fahrweg verfolgen (Standard: {grenzen.max_tiefe})",
+    )
+    parser.add_argument(
+        "--max-routes",
+        type=int,
+        default=grenzen.max_fahrstrassen,
+        help=f"höchstens so viele Fahrstraßen je Startsignal suchen (Standard: {grenzen.max_fahrstrassen})",
+    )
+    parser.add_argument(
+        "--max-switches",
+        type=int,
+        default=grenzen.max_weichen,
+        help=f"Fahrwege über mehr Weichen verwerfen (Standard: {grenzen.max_weichen})",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PFAD",
+        help="alle .str- und .fpn-Dateien in einem Verzeichnis oder aus einer Listendatei (ein Pfad je Zeile) unter ZUSI2_DATAPATH konvertieren",
+    )
+    parser.add_argument(
+        "--trn-files",
+        action="store_true",
+        help="jeden Zug in eine eigene .trn-Datei schreiben, auf die der Fahrplan verweist",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="REPORT.json",
+        help="Laufzeit und Speicherbedarf der Konvertierung je Phase und Startsignal als JSON schreiben",
+    )
+    ausgabe = parser.add_mutually_exclusive_group()
+    ausgabe.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Warnungen nicht einzeln ausgeben, sondern am Ende nur ihre Anzahl je Art",
+    )
+    ausgabe.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="zusätzlich jede gefundene Fahrstraße und jede Verknüpfung ausgeben",
+    )
+    args = parser.parse_args()
+    if (args.batch is None) == (args.strname is None):
+        parser.error("entweder strname oder --batch angeben")
+
+    if args.quiet:
+        protokoll.set_stufe(protokoll.FEHLER)
+    elif args.verbose:
+        protokoll.set_stufe(protokoll.DEBUG)
+
+    if args.profile:
+        profil.start()
+
+    manifest.load(ignorieren=args.force)
+
+    grenzen = strecke.Suchgrenzen(args.max_depth, args.max_routes, args.max_switches)
+    erfolg = True
+    if args.batch is not None:
+        strecken, ohne_strecke = stapel.finden(args.batch)
+        ergebnisse = stapel.konvertieren(
+            strecken,
+            args.jobs,
+            ignorieren=args.force,
+            grenzen=grenzen,
+            trn_dateien=args.trn_files,
+        )
+    else:
+        try:
+            if args.jobs > 1 and args.fpnnames:
+                # Die Fahrpläne brauchen nur den Dateikopf der Strecke und
+                # laufen parallel zu ihrer Konvertierung, mit der sie sich die
+                # Prozesse teilen.
+                st3_name, rekursionstiefe = strecke.kopf(args.strname)
+                with fahrplan.conv_fpn_parallel(
+                    args.fpnnames,
+                    st3_name,
+                    rekursionstiefe,
+                    args.jobs,
+                    ignorieren=args.force,
+                    trn_dateien=args.trn_files,
+                ) as (bezuege, strecke_jobs):
+                    strecke.conv_str(args.strname, jobs=strecke_jobs, grenzen=grenzen)
+                schnappschuss = strecke.schnappschuss(args.strname, grenzen)
+                for fpnname in args.fpnnames:
+                    fahrplan.pruefen(fpnname, bezuege[fpnname], schnappschuss)
+            else:
+                (st3_name, rekursionstiefe) = strecke.conv_str(
+                    args.strname, jobs=args.jobs, grenzen=grenzen
+                )
+                schnappschuss = strecke.schnappschuss(args.strname, grenzen)
+                for fpnname in args.fpnnames:
+                    bezuege = fahrplan.conv_fpn(
+                        fpnname,
+                        st3_name,
+                        rekursionstiefe,
+                        jobs=args.jobs,
+                        trn_dateien=args.trn_files,
+                    )
+                    fahrplan.pruefen(fpnname, bezuege, schnappschuss)
+        except common.ParseError as e:
+            protokoll.fehler("%s", e)
+            erfolg = False
+
+    manifest.save()
+
+    if args.profile:
+        profil.save(args.profile)
+
+    cache_info = landschaft.conv_ls_cache_info()
+    protokoll.info(
+        "conv_ls-Cache: %s Treffer, %s Fehlschläge, %s Einträge",
+        cache_info.hits,
+        cache_info.misses,
+        cache_info.currsize,
+    )
+    protokoll.zusammenfassung(args.profile)
+
+    if args.batch is not None:
+        erfolg = stapel.zusammenfassung(ergebnisse, ohne_strecke)
+    if not erfolg:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
+import itertools
 import os
 
 Z3ABS = os.environ["ZUSI3_DATAPATH"]
@@ -20,17 +22,131 @@ def z3rel_to_abs(filename):
     return os.path.join(Z3ABS, filename).replace("\\", os.sep)
 
 
-def readfloat(f):
-    line = f.readline()
-    if line.startswith("#"):
-        return None
-    else:
-        return float(line.strip().replace(",", "."))
+class ParseError(ValueError):
+    pass
 
 
-def readfloatstr(f):
-    line = f.readline()
-    if line.startswith("#"):
-        return None
-    else:
-        return line.strip().replace(",", ".")
+# Liest eine zeilenbasierte Zusi-2-Datei (.str, .ls, .fpn, .zug) auf einmal ein
+# und liefert die Werte Zeile für Zeile. Zahlen werden direkt aus den Bytes
+# gelesen, nur Zeichenketten werden dekodiert. Bei Lesefehlern wird eine
+# ParseError mit Zeilennummer und Byte-Offset der betroffenen Zeile geworfen.
+class Reader:
+    __slots__ = ("name", "encoding", "_f", "_laenge", "_readline")
+
+    def __init__(self, filename, encoding="iso-8859-1"):
+        with open(filename, "rb") as f:
+            daten = f.read()
+        self.name = filename
+        self.encoding = encoding
+        self._laenge = len(daten)
+        self._f = io.BytesIO(daten)
+        self._readline = self._f.readline
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def eof(self):
+        return self._f.tell() >= self._laenge
+
+    # offset: Beginn der betroffenen Zeile, Standard ist die zuletzt gelesene
+    def fehler(self, meldung, offset=None):
+        daten = self._f.getvalue()
+        if offset is None:
+            offset = daten.rfind(b"\n", 0, max(self._f.tell() - 1, 0)) + 1
+        zeile = daten.count(b"\n", 0, offset) + 1
+        return ParseError(f"{self.name}, Zeile {zeile} (Byte {offset}): {meldung}")
+
+    def _eof_fehler(self):
+        return self.fehler("unerwartetes Dateiende", self._laenge)
+
+    def _wertfehler(self, erwartet, zeile):
+        if not zeile:
+            return self._eof_fehler()
+        zeile = zeile.decode(self.encoding).rstrip()
+        return self.fehler(f"{erwartet} erwartet: {zeile!r}")
+
+    def next_line(self):
+        if not (zeile := self._readline()):
+            raise self._eof_fehler()
+        return zeile.decode(self.encoding).rstrip("\r\n")
+
+    def next_str(self):
+        if not (zeile := self._readline()):
+            raise self._eof_fehler()
+        return zeile.decode(self.encoding).strip()
+
+    def next_int(self):
+        zeile = self._readline()
+        try:
+            return int(zeile)
+        except ValueError:
+            raise self._wertfehler("Ganzzahl", zeile) from None
+
+    # None bei "#" (Wert nicht vorhanden)
+    def next_float(self):
+        zeile = self._readline()
+        if zeile.startswith(b"#"):
+            return None
+        try:
+            return float(zeile.replace(b",", b"."))
+        except ValueError:
+            raise self._wertfehler("Zahl", zeile) from None
+
+    # Wie next_float(), aber als Zeichenkette mit Dezimalpunkt
+    def next_floatstr(self):
+        if not (zeile := self._readline()):
+            raise self._eof_fehler()
+        if zeile.startswith(b"#"):
+            return None
+        return zeile.decode(self.encoding).strip().replace(",", ".")
+
+    # n Zahlen am Stück (ohne "#"-Einträge)
+    def next_floats(self, n):
+        start = self._f.tell()
+        zeilen = self._next_lines(n)
+        try:
+            werte = list(map(float, b"".join(zeilen).replace(b",", b".").split()))
+        except ValueError:
+            pass
+        else:
+            if len(werte) == n:
+                return werte
+        # Fehlerhafte Zeile suchen
+        for zeile in zeilen:
+            try:
+                float(zeile.replace(b",", b"."))
+            except ValueError:
+                break
+            start += len(zeile)
+        zeile = zeile.decode(self.encoding).rstrip()
+        raise self.fehler(f"Zahl erwartet: {zeile!r}", start)
+
+    def _next_lines(self, n):
+        zeilen = list(itertools.islice(self._f, n))
+        if len(zeilen) < n:
+            raise self._eof_fehler()
+        return zeilen
+
+    def skip(self, n=1):
+        if n == 1:
+            if not self._readline():
+                raise self._eof_fehler()
+        else:
+            self._next_lines(n)
+
+    # Liefert alle Zeilen bis zur nächsten Zeile, die mit ende beginnt.
+    # Die Endzeile selbst wird übersprungen.
+    def next_until(self, ende="#"):
+        ende = ende.encode(self.encoding)
+        ergebnis = []
+        while not (zeile := self._readline()).startswith(ende):
+            if not zeile:
+                raise self._eof_fehler()
+            ergebnis.append(zeile.decode(self.encoding).strip())
+        return ergebnis
@@ -1,125 +1,505 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
+import concurrent.futures
+import contextlib
 import os
+import re
+import traceback
 import xml.etree.ElementTree as ET
+from collections import Counter, namedtuple
 
-from . import common
+from . import common, manifest, protokoll
 
+Zug = namedtuple(
+    "Zug",
+    [
+        "zugnr",
+        "gattung",
+        "spzugniedriger",
+        "prio",
+        "zuglauf",
+        "fahrstrname",
+        "eintraege",  # (Betrst, Ank, Abf, [Gleis])
+        "zugwenden",  # Betriebsstellen mit Zugwende
+    ],
+)
 
-def conv_fpn(fpnname, st3_name, rekursionstiefe):
-    seen_nrs = set()
-    with open(fpnname, "r", encoding="iso-8859-1") as f:
-        f.readline()
 
-        inname2_rel = (
-            os.path.relpath(fpnname, common.Z2ABS).replace(os.sep, "\\")[:-1] + "n"
+# trn_dateien: jeden Zug in eine eigene .trn-Datei schreiben, sobald er
+# erzeugt ist, statt alle Züge im Fahrplan selbst zu speichern. Die .trn-Dateien
+# liegen in einem Verzeichnis mit dem Namen des Fahrplans.
+#
+# zug_cache: Cache für Züge, die auch in anderen Fahrplänen vorkommen, siehe
+# _zug_cache_neu(). Alle übrigen Züge werden nach dem Schreiben verworfen.
+def conv_fpn(
+    fpnname, st3_name, rekursionstiefe, jobs=1, trn_dateien=False, zug_cache=None
+):
+    manifest_key = _manifest_key(fpnname, st3_name, rekursionstiefe)
+    with manifest.aufzeichnung() as aufzeichnung:
+        if (bezuege := _nachschlagen(manifest_key, trn_dateien)) is not None:
+            protokoll.info("%s unverändert, wird nicht konvertiert", fpnname)
+            return bezuege
+        bezuege = _conv_fpn(
+            fpnname, st3_name, rekursionstiefe, jobs, trn_dateien, zug_cache
         )
-        outname2_rel = common.z2rel_to_z3rel(inname2_rel)
-        outname2_abs = common.z3rel_to_abs(outname2_rel)
-
-        print(f"{fpnname} -> {outname2_abs}", file=sys.stderr)
-        n_root = ET.Element("Zusi")
-        tree = ET.ElementTree(n_root)
-        n_fahrplan = ET.SubElement(
-            n_root, "Fahrplan", {"AnfangsZeit": f.readline().strip()}
+        manifest.store(
+            "fpn",
+            manifest_key,
+            aufzeichnung,
+            {"trn_dateien": trn_dateien, "bezuege": bezuege},
         )
-        ET.SubElement(
-            ET.SubElement(n_fahrplan, "StrModul"), "Datei", {"Dateiname": st3_name}
+    return bezuege
+
+
+def _manifest_key(fpnname, st3_name, rekursionstiefe):
+    return f"{os.path.abspath(fpnname)}|{st3_name}|{rekursionstiefe}"
+
+
+# Die Art der Ausgabe gehört zum Ergebnis, nicht zum Schlüssel: Beide schreiben
+# dieselbe Fahrplandatei, die beim Wechsel neu geschrieben werden muss.
+def _nachschlagen(manifest_key, trn_dateien):
+    ergebnis = manifest.lookup("fpn", manifest_key)
+    if ergebnis is None or ergebnis["trn_dateien"] != trn_dateien:
+        return None
+    return ergebnis["bezuege"]
+
+
+def _unveraendert(fpnname, st3_name, rekursionstiefe, trn_dateien):
+    with manifest.aufzeichnung():
+        manifest_key = _manifest_key(fpnname, st3_name, rekursionstiefe)
+        return _nachschlagen(manifest_key, trn_dateien) is not None
+
+
+# Prüft die Bezüge eines Fahrplans, wie conv_fpn() sie liefert, gegen den
+# Schnappschuss der Strecke (strecke.schnappschuss()): gibt es die FahrstrName
+# der Züge und zu jedem FahrplanSignalEintrag ein Hauptsignal?
+def pruefen(fpnname, bezuege, schnappschuss):
+    if schnappschuss is None:
+        protokoll.warnung(
+            "Fahrpläne ohne Prüfung",
+            "%s: kein Schnappschuss der Strecke, nicht geprüft",
+            fpnname,
         )
+        return
+    for gattung, zugnr, fahrstrname, signale in bezuege:
+        if fahrstrname is not None and fahrstrname not in schnappschuss.fahrstrassen:
+            protokoll.warnung(
+                "Züge ohne passende Fahrstraße",
+                "%s: %s %s: keine Fahrstraße %s",
+                fpnname,
+                gattung,
+                zugnr,
+                fahrstrname,
+            )
+        for betrst, gleis in signale:
+            if (betrst, gleis) not in schnappschuss.gleise:
+                protokoll.warnung(
+                    "Fahrplaneinträge ohne Hauptsignal",
+                    "%s: %s %s: kein Hauptsignal %s %s",
+                    fpnname,
+                    gattung,
+                    zugnr,
+                    betrst,
+                    gleis,
+                )
+
+
+# Liest eine .zug-Datei. Läuft mit jobs > 1 in einem Worker-Prozess, die
+# Zugnummern werden erst danach in der Reihenfolge des Fahrplans eindeutig
+# gemacht.
+def _zug_lesen(zugname):
+    with common.Reader(zugname) as f2:
+        f2.skip()
+        zugnr = f2.next_str()
+        gattung = f2.next_str()
+        f2.skip()  # TODO Bremsstellung
+        n_fahrzeuge_minus_1 = f2.next_int()
+        lok_gedreht = f2.next_str() == "-1"
+        f2.skip()
+        spzugniedriger = str(f2.next_float() / 3.6)
+        f2.skip()
+        f2.skip()  # Lok
+        f2.next_until("#IF")  # PZB-Modus
+        prio = f2.next_str()
+        f2.skip()  # Einsatzreferenz
+        f2.skip()  # Treibstoffvorrat
+        f2.skip()  # reserviert
+        f2.skip()  # reserviert
+        f2.skip()  # Zugtyp
+        zuglauf = f2.next_str()
+        f2.skip()  # Türsystem
+        f2.skip(6)  # reserviert
+        fahrstrname = None
+        eintraege = []
+        zugwenden = []
+        while (betrst := f2.next_str()) != "#IF":
+            ank = f2.next_str()
+            abf = f2.next_str()
+            gleise = []
+            while (gleis := f2.next_str()) != "#":
+                gleise.append(gleis)
+                if fahrstrname is None:
+                    fahrstrname = f"Aufgleispunkt -> {betrst} {gleis}"
+            # Einträge nach einer Zugwende werden verworfen. TODO
+            if not zugwenden:
+                eintraege.append((betrst, ank, abf, gleise))
+            while (spezialaktion := f2.next_str()) != "#":
+                if spezialaktion in ["1", "2"]:
+                    zugwenden.append(betrst)
+                f2.skip(2)
+            f2.skip()
+
+        f2.skip(3 * n_fahrzeuge_minus_1)
+
+    return Zug(
+        zugnr, gattung, spzugniedriger, prio, zuglauf, fahrstrname, eintraege, zugwenden
+    )
+
+
+def _init_worker(stufe, ignorieren):
+    protokoll.worker_init(stufe)
+    manifest.worker_init(ignorieren)
+
+
+# gruppe: [(Fahrplan, [Zugdatei])], Fahrpläne mit gemeinsamen Zügen. Liefert
+# je Fahrplan die Bezüge oder die Ausnahme seiner Konvertierung.
+def _worker(gruppe, st3_name, rekursionstiefe, jobs, trn_dateien):
+    zug_cache = _zug_cache_neu(zugnamen for _, zugnamen in gruppe)
+    ergebnisse = []
+    for fpnname, _ in gruppe:
+        try:
+            ergebnisse.append(
+                conv_fpn(
+                    fpnname, st3_name, rekursionstiefe, jobs, trn_dateien, zug_cache
+                )
+            )
+        except Exception as e:
+            protokoll.debug("%s", traceback.format_exc())
+            ergebnisse.append(e)
+    return ergebnisse, manifest.abholen(), protokoll.abholen()
+
+
+# Konvertiert die Fahrpläne in Worker-Prozessen, während der with-Block läuft,
+# z.B. die Konvertierung der Strecke; st3_name und rekursionstiefe liefert
+# vorab strecke.kopf(). Am Ende des with-Blocks wird auf alle Fahrpläne
+# gewartet und der Fehler des ersten fehlgeschlagenen Fahrplans geworfen.
+#
+# Vorab werden nur die Zuglisten der Fahrpläne gelesen. Fahrpläne mit
+# gemeinsamen Zügen landen in derselben Aufgabe, die jeden dieser Züge nur
+# einmal liest; die .zug-Dateien selbst werden erst in den Workern gelesen.
+# Die Fahrpläne bekommen die Hälfte der jobs Prozesse, der with-Block den Rest.
+#
+# Liefert ein dict, das dann die Bezüge je Fahrplan enthält, und die Zahl der
+# Prozesse für den with-Block.
+@contextlib.contextmanager
+def conv_fpn_parallel(
+    fpnnames, st3_name, rekursionstiefe, jobs, ignorieren=False, trn_dateien=False
+):
+    gruppen = _gruppieren(
+        [
+            (fpnname, _zugnamen(fpnname, st3_name, rekursionstiefe, trn_dateien))
+            for fpnname in fpnnames
+        ]
+    )
+
+    fpn_jobs = max(1, jobs // 2)
+    worker = min(len(gruppen), fpn_jobs)
+    # Gibt es weniger Aufgaben als Prozesse, lesen die Aufgaben ihre Züge
+    # selbst parallel.
+    zug_jobs = fpn_jobs // worker
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker,
+        initializer=_init_worker,
+        initargs=(protokoll.stufe(), ignorieren),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _worker, gruppe, st3_name, rekursionstiefe, zug_jobs, trn_dateien
+            )
+            for gruppe in gruppen
+        ]
+        ergebnisse = {}
+        try:
+            yield ergebnisse, max(1, jobs - fpn_jobs)
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+        concurrent.futures.wait(futures)
+        fehler = {}
+        for gruppe, future in zip(gruppen, futures):
+            if future.exception() is not None:
+                for fpnname, _ in gruppe:
+                    fehler[fpnname] = future.exception()
+                continue
+            gruppen_ergebnisse, eintraege, warnungen = future.result()
+            for (fpnname, _), ergebnis in zip(gruppe, gruppen_ergebnisse):
+                if isinstance(ergebnis, Exception):
+                    fehler[fpnname] = ergebnis
+                else:
+                    ergebnisse[fpnname] = ergebnis
+            manifest.uebernehmen(eintraege)
+            protokoll.melden(warnungen)
+        for fpnname in fpnnames:
+            if fpnname in fehler:
+                raise fehler[fpnname]
+
+
+# Die Zugdateien eines Fahrplans, der konvertiert werden muss. Für unveränderte
+# und nicht lesbare Fahrpläne eine leere Liste; den Fehler meldet dann die
+# Konvertierung des Fahrplans.
+def _zugnamen(fpnname, st3_name, rekursionstiefe, trn_dateien):
+    if _unveraendert(fpnname, st3_name, rekursionstiefe, trn_dateien):
+        return []
+    try:
+        return _fpn_lesen(fpnname)[1]
+    except Exception:
+        protokoll.debug("%s", traceback.format_exc())
+        return []
+
+
+# Fasst die Fahrpläne [(Fahrplan, [Zugdatei])] zu Gruppen zusammen, die
+# untereinander keine Züge teilen, in der Reihenfolge ihres ersten Fahrplans.
+def _gruppieren(fahrplaene):
+    gruppe_von = {}  # Zug-Schlüssel -> Index der Gruppe
+    gruppen = []
+    for fahrplan in fahrplaene:
+        keys = {_zug_cache_key(zugname) for zugname in fahrplan[1]}
+        betroffen = sorted({gruppe_von[key] for key in keys if key in gruppe_von})
+        if not betroffen:
+            ziel = len(gruppen)
+            gruppen.append([])
+        else:
+            ziel = betroffen[0]
+            for i in betroffen[1:]:
+                gruppen[ziel].extend(gruppen[i])
+                gruppen[i] = []
+            for key, i in gruppe_von.items():
+                if i in betroffen:
+                    gruppe_von[key] = ziel
+        gruppen[ziel].append(fahrplan)
+        for key in keys:
+            gruppe_von[key] = ziel
+    reihenfolge = {fahrplan[0]: i for i, fahrplan in enumerate(fahrplaene)}
+    return [
+        sorted(gruppe, key=lambda fahrplan: reihenfolge[fahrplan[0]])
+        for gruppe in gruppen
+        if gruppe
+    ]
+
+
+def _zug_cache_key(zugname):
+    zugname_abs = os.path.normcase(os.path.abspath(zugname))
+    try:
+        st = os.stat(zugname_abs)
+    except OSError:
+        return (zugname_abs, None, None)
+    return (zugname_abs, st.st_mtime_ns, st.st_size)
 
-        while (zugdatei := f.readline()) :
-            n_trn = ET.SubElement(
-                n_fahrplan, "trn", {"Rekursionstiefe": str(rekursionstiefe)}
+
+# Cache für die Züge, die in den Zuglisten mehr als einmal vorkommen:
+# {Schlüssel: None}, bis der Zug zum ersten Mal gelesen ist.
+def _zug_cache_neu(zugnamen_listen):
+    anzahl = Counter(
+        _zug_cache_key(zugname) for zugnamen in zugnamen_listen for zugname in zugnamen
+    )
+    return {key: None for key, n in anzahl.items() if n > 1}
+
+
+# Liefert die Züge nacheinander in der Reihenfolge von zugnamen. Mit jobs > 1
+# werden sie parallel vorausgelesen, sonst erst, wenn sie gebraucht werden.
+# Züge aus zug_cache werden nicht noch einmal gelesen.
+def _zuege_lesen(zugnamen, jobs, zug_cache):
+    keys = [_zug_cache_key(zugname) for zugname in zugnamen]
+    # Jeder Schlüssel nur einmal: mehrfach vorkommende Züge stehen in zug_cache.
+    fehlend = {}
+    for key, zugname in zip(keys, zugnamen):
+        if zug_cache.get(key) is None:
+            fehlend.setdefault(key, zugname)
+    with contextlib.ExitStack() as stack:
+        if jobs > 1 and len(fehlend) > 1:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
             )
-            with open(
+            chunksize = max(1, len(fehlend) // (4 * jobs))
+            gelesen = executor.map(_zug_lesen, fehlend.values(), chunksize=chunksize)
+        else:
+            gelesen = map(_zug_lesen, fehlend.values())
+        for key in keys:
+            if (zug := zug_cache.get(key)) is None:
+                # Wirft bei einer fehlerhaften Zugdatei deren ParseError.
+                zug = next(gelesen)
+                if key in zug_cache:
+                    zug_cache[key] = zug
+            yield zug
+
+
+# Liest den Fahrplan: (Anfangszeit, [Zugdatei])
+def _fpn_lesen(fpnname):
+    with common.Reader(fpnname) as f:
+        f.skip()
+        anfangszeit = f.next_str()
+        zugnamen = []
+        while not f.eof():
+            zugdatei = f.next_line()
+            zugnamen.append(
                 os.path.join(
                     os.path.dirname(fpnname), zugdatei.strip().replace("\\", os.sep)
-                ),
-                "r",
-                encoding="iso-8859-1",
-            ) as f2:
-                f2.readline()
-                orig_zugnr = f2.readline().strip()
-                zugnr = orig_zugnr
-                i = 1
-                while zugnr in seen_nrs:
-                    zugnr = f"{orig_zugnr}_{i}"
-                    i += 1
-                seen_nrs.add(zugnr)
-                n_trn.attrib["Nummer"] = zugnr
-                n_trn.attrib["Gattung"] = f2.readline().strip()
-                f2.readline().strip()  # TODO Bremsstellung
-                n_fahrzeuge_minus_1 = int(f2.readline())
-                lok_gedreht = f2.readline().strip() == "-1"
-                f2.readline()
-                n_trn.attrib["spZugNiedriger"] = str(float(f2.readline()) / 3.6)
-                f2.readline()
-                f2.readline()  # Lok
-                while f2.readline().strip() != "#IF":  # PZB-Modus
-                    pass
-                n_trn.attrib["Prio"] = f2.readline().strip()
-                f2.readline()  # Einsatzreferenz
-                f2.readline()  # Treibstoffvorrat
-                f2.readline()  # reserviert
-                f2.readline()  # reserviert
-                f2.readline()  # Zugtyp
-                n_trn.attrib["Zuglauf"] = f2.readline().strip()
-                f2.readline()  # Türsystem
-                for i in range(6):
-                    f2.readline()  # reserviert
-                erster_eintrag = True
-                hat_zugwende = False
-                while (betrst := f2.readline().strip()) != "#IF":
-                    n_fahrplaneintrag = ET.SubElement(
-                        n_trn, "FahrplanEintrag", {"Betrst": betrst}
-                    )
-                    n_fahrplaneintrag.attrib["Ank"] = f2.readline().strip()
-                    n_fahrplaneintrag.attrib["Abf"] = f2.readline().strip()
-                    while (gleis := f2.readline().strip()) != "#":
-                        ET.SubElement(
-                            n_fahrplaneintrag,
-                            "FahrplanSignalEintrag",
-                            {"FahrplanSignal": gleis},
-                        )
-                        if erster_eintrag:
-                            erster_eintrag = False
-                            n_trn.attrib[
-                                "FahrstrName"
-                            ] = f"Aufgleispunkt -> {betrst} {gleis}"
-                    if hat_zugwende:
-                        n_trn.remove(n_fahrplaneintrag)  # TODO
-                    while (spezialaktion := f2.readline().strip()) != "#":
-                        if spezialaktion in ["1", "2"]:
-                            print(
-                                f'{n_trn.attrib["Gattung"]} {n_trn.attrib["Nummer"]}: Zugwende {n_fahrplaneintrag.attrib["Betrst"]}',
-                                file=sys.stderr,
-                            )
-                            hat_zugwende = True
-                        f2.readline()
-                        f2.readline()
-                    f2.readline()
-
-                for i in range(n_fahrzeuge_minus_1):
-                    f2.readline()
-                    f2.readline()
-                    f2.readline()
+                )
+            )
+    return anfangszeit, zugnamen
+
+
+# Dateiname der .trn-Datei eines Zuges, ohne in Dateinamen unzulässige Zeichen
+# und eindeutig auch auf Dateisystemen, die Groß- und Kleinschreibung nicht
+# unterscheiden.
+def _trn_name(gattung, zugnr, vergeben):
+    basis = re.sub(r'[\\/:*?"<>|]', "_", f"{gattung} {zugnr}")
+    name = basis
+    i = 1
+    while name.lower() in vergeben:
+        name = f"{basis}_{i}"
+        i += 1
+    vergeben.add(name.lower())
+    return f"{name}.trn"
+
+
+# Entfernt die .trn-Dateien einer früheren Konvertierung, damit weder Züge, die
+# es nicht mehr gibt, noch nach einem Lauf ohne trn_dateien das Verzeichnis
+# liegen bleiben.
+def _trn_dateien_entfernen(trn_verzeichnis_abs):
+    try:
+        dateinamen = os.listdir(trn_verzeichnis_abs)
+    except OSError:
+        return
+    for dateiname in dateinamen:
+        if dateiname.lower().endswith(".trn"):
+            os.remove(os.path.join(trn_verzeichnis_abs, dateiname))
+    with contextlib.suppress(OSError):
+        os.rmdir(trn_verzeichnis_abs)
+
+
+# Liefert die Bezüge der Züge auf die Strecke für pruefen():
+# [[Gattung, Zugnummer, FahrstrName, [[Betrst, FahrplanSignal]]]]
+def _conv_fpn(fpnname, st3_name, rekursionstiefe, jobs, trn_dateien, zug_cache):
+    bezuege = []
+    seen_nrs = set()
+    suffixe = {}  # Zugnummer -> nächstes zu prüfendes Suffix
+    anfangszeit, zugnamen = _fpn_lesen(fpnname)
+    if zug_cache is None:
+        zug_cache = _zug_cache_neu([zugnamen])
+    manifest.quelle(os.path.abspath(fpnname))
+    for zugname in zugnamen:
+        manifest.quelle(os.path.abspath(zugname))
+
+    inname2_rel = (
+        os.path.relpath(fpnname, common.Z2ABS).replace(os.sep, "\\")[:-1] + "n"
+    )
+    outname2_rel = common.z2rel_to_z3rel(inname2_rel)
+    outname2_abs = common.z3rel_to_abs(outname2_rel)
+
+    protokoll.info("%s -> %s", fpnname, outname2_abs)
 
+    trn_verzeichnis_rel = os.path.splitext(outname2_rel)[0]
+    _trn_dateien_entfernen(common.z3rel_to_abs(trn_verzeichnis_rel))
+    if trn_dateien:
+        os.makedirs(common.z3rel_to_abs(trn_verzeichnis_rel), exist_ok=True)
+        trn_namen = set()
+
+    n_root = ET.Element("Zusi")
+    tree = ET.ElementTree(n_root)
+    n_fahrplan = ET.SubElement(n_root, "Fahrplan", {"AnfangsZeit": anfangszeit})
+    ET.SubElement(
+        ET.SubElement(n_fahrplan, "StrModul"), "Datei", {"Dateiname": st3_name}
+    )
+
+    for zug in _zuege_lesen(zugnamen, jobs, zug_cache):
+        n_trn = ET.Element(
+            "Zug" if trn_dateien else "trn", {"Rekursionstiefe": str(rekursionstiefe)}
+        )
+        # Doppelte Zugnummern bekommen das kleinste freie Suffix _1, _2, ...
+        # Weil seen_nrs nur wächst, kann die Suche beim zuletzt vergebenen
+        # Suffix derselben Nummer weitermachen.
+        zugnr = zug.zugnr
+        i = suffixe.get(zugnr, 1)
+        while zugnr in seen_nrs:
+            zugnr = f"{zug.zugnr}_{i}"
+            i += 1
+        suffixe[zug.zugnr] = i
+        seen_nrs.add(zugnr)
+        n_trn.attrib["Nummer"] = zugnr
+        n_trn.attrib["Gattung"] = zug.gattung
+        n_trn.attrib["spZugNiedriger"] = zug.spzugniedriger
+        n_trn.attrib["Prio"] = zug.prio
+        n_trn.attrib["Zuglauf"] = zug.zuglauf
+        if zug.fahrstrname is not None:
+            n_trn.attrib["FahrstrName"] = zug.fahrstrname
+        for betrst in zug.zugwenden:
+            protokoll.warnung(
+                "Zugwenden (nicht unterstützt)",
+                "%s %s: Zugwende %s",
+                zug.gattung,
+                zugnr,
+                betrst,
+            )
+
+        bezuege.append(
+            [
+                zug.gattung,
+                zugnr,
+                zug.fahrstrname,
+                [
+                    [betrst, gleis]
+                    for betrst, _, _, gleise in zug.eintraege
+                    for gleis in gleise
+                ],
+            ]
+        )
+
+        for betrst, ank, abf, gleise in zug.eintraege:
+            n_fahrplaneintrag = ET.SubElement(
+                n_trn, "FahrplanEintrag", {"Betrst": betrst, "Ank": ank, "Abf": abf}
+            )
+            for gleis in gleise:
+                ET.SubElement(
+                    n_fahrplaneintrag,
+                    "FahrplanSignalEintrag",
+                    {"FahrplanSignal": gleis},
+                )
+
+        ET.SubElement(
             ET.SubElement(
                 ET.SubElement(
-                    ET.SubElement(
-                        n_trn,
-                        "FahrzeugVarianten",
-                        {"Bezeichnung": "default", "ZufallsWert": "1"},
-                    ),
-                    "FahrzeugInfo",
-                    {"IDHaupt": "1", "IDNeben": "1"},
+                    n_trn,
+                    "FahrzeugVarianten",
+                    {"Bezeichnung": "default", "ZufallsWert": "1"},
                 ),
-                "Datei",
-                {
-                    "Dateiname": r"rollingstock\Deutschland\Epoche5\Dieseltriebwagen\RegioShuttle\RS1.rv.fzg"
-                },
+                "FahrzeugInfo",
+                {"IDHaupt": "1", "IDNeben": "1"},
+            ),
+            "Datei",
+            {
+                "Dateiname": r"rollingstock\Deutschland\Epoche5\Dieseltriebwagen\RegioShuttle\RS1.rv.fzg"
+            },
+        )
+
+        if trn_dateien:
+            trn_rel = (
+                trn_verzeichnis_rel + "\\" + _trn_name(zug.gattung, zugnr, trn_namen)
+            )
+            trn_abs = common.z3rel_to_abs(trn_rel)
+            n_zusi = ET.Element("Zusi")
+            n_zusi.append(n_trn)
+            ET.ElementTree(n_zusi).write(trn_abs, encoding="unicode")
+            manifest.ausgabe(trn_abs)
+            ET.SubElement(
+                ET.SubElement(n_fahrplan, "Zug"), "Datei", {"Dateiname": trn_rel}
             )
+        else:
+            n_fahrplan.append(n_trn)
 
-        tree.write(outname2_abs, encoding="unicode")
+    os.makedirs(os.path.dirname(outname2_abs), exist_ok=True)
+    tree.write(outname2_abs, encoding="unicode")
+    manifest.ausgabe(outname2_abs)
+    return bezuege
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import array
+
+# Eigenschaften eines Streckenelements (Bitmaske in Gleisgraph.flags)
+REGISTER = 1
+AUFLOESEPUNKT = 2
+SIGNAL = 4  # Hauptsignal mit Betriebsstelle und Gleis
+FAHRSTRSIGNAL = 8
+KREIS = 16  # liegt auf einem Gleiskreis ohne Hauptsignal (siehe kreise())
+
+
+# Kompakter Graph der Streckenelemente für die Fahrstraßensuche.
+#
+# Die Elemente werden über ihren Index (Reihenfolge in der .str-Datei)
+# angesprochen. Nachfolger und Vorgänger stehen wie bei einer CSR-Matrix in
+# zusammenhängenden Arrays: die Nachfolger von Element i sind
+# succ[succ_start[i]:succ_start[i + 1]], die Vorgänger entsprechend in pred.
+# Die Vorgänger stehen in derselben Reihenfolge wie die NachGegen-Verweise.
+class Gleisgraph:
+    __slots__ = ("nr", "index", "flags", "succ_start", "succ", "pred_start", "pred")
+
+    def __init__(self):
+        self.nr = array.array("q")  # Index -> Elementnummer
+        self.index = {}  # Elementnummer -> Index
+        self.flags = bytearray()
+        self.succ_start = array.array("q", [0])
+        self.succ = array.array("q")  # bis finish() Elementnummern, danach Indizes
+        self.pred_start = array.array("q", [0])
+        self.pred = array.array("q")
+
+    def __len__(self):
+        return len(self.nr)
+
+    def add(self, elem_nr, succ, flags=0):
+        self.index[elem_nr] = len(self.nr)
+        self.nr.append(elem_nr)
+        self.flags.append(flags)
+        self.succ.extend(succ)
+        self.succ_start.append(len(self.succ))
+
+    def succs(self, i):
+        return self.succ[self.succ_start[i] : self.succ_start[i + 1]]
+
+    def preds(self, i):
+        return self.pred[self.pred_start[i] : self.pred_start[i + 1]]
+
+    # Übersetzt die Nachfolger in Indizes und baut die Vorgängerlisten auf.
+    # Liefert die Indizes aller Elemente mit mehr als einem Vorgänger, in der
+    # Reihenfolge, in der jeweils der zweite Vorgänger gefunden wird.
+    def finish(self):
+        index = self.index
+        succ = self.succ
+        for k, nr in enumerate(succ):
+            try:
+                succ[k] = index[nr]
+            except KeyError:
+                raise ValueError(f"Nachfolger {nr} existiert nicht") from None
+
+        n = len(self.nr)
+        anzahl = array.array("q", bytes(8 * n))
+        zusammenfuehrungen = []
+        for s in succ:
+            anzahl[s] += 1
+            if anzahl[s] == 2:
+                zusammenfuehrungen.append(s)
+
+        pred_start = self.pred_start = array.array("q", [0])
+        for i in range(n):
+            pred_start.append(pred_start[-1] + anzahl[i])
+
+        pred = self.pred = array.array("q", bytes(8 * len(succ)))
+        pos = pred_start[:-1]
+        succ_start = self.succ_start
+        for i in range(n):
+            for k in range(succ_start[i], succ_start[i + 1]):
+                s = succ[k]
+                pred[pos[s]] = i
+                pos[s] += 1
+
+        return zusammenfuehrungen
+
+    # Sucht Gleiskreise ohne Hauptsignal, auf denen die Fahrstraßensuche kein
+    # Ende fände: starke Zusammenhangskomponenten (Tarjan, iterativ) des
+    # Graphen ohne die Elemente mit SIGNAL, die mehr als ein Element oder eine
+    # Schleife auf sich selbst enthalten. Ihre Elemente erhalten das Flag
+    # KREIS. Liefert die Komponenten als Listen von Indizes.
+    def kreise(self):
+        n = len(self.nr)
+        flags = self.flags
+        succ = self.succ
+        succ_start = self.succ_start
+        nummer = array.array("q", [-1]) * n  # Besuchsreihenfolge
+        tiefste = array.array("q", bytes(8 * n))  # lowlink
+        auf_stapel = bytearray(n)
+        stapel = []
+        kreise = []
+        zaehler = 0
+
+        for wurzel in range(n):
+            if nummer[wurzel] >= 0 or flags[wurzel] & SIGNAL:
+                continue
+            # (Element, Position des nächsten zu prüfenden Nachfolgers)
+            pfad = [(wurzel, succ_start[wurzel])]
+            nummer[wurzel] = tiefste[wurzel] = zaehler
+            zaehler += 1
+            stapel.append(wurzel)
+            auf_stapel[wurzel] = 1
+            while pfad:
+                i, k = pfad[-1]
+                if k < succ_start[i + 1]:
+                    pfad[-1] = (i, k + 1)
+                    s = succ[k]
+                    if flags[s] & SIGNAL:
+                        continue
+                    if nummer[s] < 0:
+                        nummer[s] = tiefste[s] = zaehler
+                        zaehler += 1
+                        stapel.append(s)
+                        auf_stapel[s] = 1
+                        pfad.append((s, succ_start[s]))
+                    elif auf_stapel[s]:
+                        tiefste[i] = min(tiefste[i], nummer[s])
+                    continue
+
+                pfad.pop()
+                if pfad:
+                    eltern = pfad[-1][0]
+                    tiefste[eltern] = min(tiefste[eltern], tiefste[i])
+                if tiefste[i] == nummer[i]:
+                    komponente = []
+                    while True:
+                        s = stapel.pop()
+                        auf_stapel[s] = 0
+                        komponente.append(s)
+                        if s == i:
+                            break
+                    if len(komponente) > 1 or i in self.succs(i):
+                        for s in komponente:
+                            flags[s] |= KREIS
+                        komponente.sort()
+                        kreise.append(komponente)
+        return kreise
@@ -1,83 +1,122 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
+import concurrent.futures
 import os
 import math
 import xml.etree.ElementTree as ET
 from collections import namedtuple
 
-from . import common
-from .common import readfloat, readfloatstr
+from . import common, manifest, protokoll
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 VerknParameter = namedtuple(
     "VerknParameter", ["dateiname_zusi", "x", "y", "z", "rx", "ry", "rz", "boundingr"]
 )
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "currsize"])
+
+# Prozessweiter Cache für bereits konvertierte ls-Dateien.
+# Schlüssel: (Quelldatei, no_displacement, mtime, Dateigröße)
+_conv_ls_cache = {}
+_conv_ls_cache_hits = 0
+_conv_ls_cache_misses = 0
+
+
+def conv_ls_cache_info():
+    return CacheInfo(_conv_ls_cache_hits, _conv_ls_cache_misses, len(_conv_ls_cache))
+
+
+def conv_ls_cache_clear():
+    global _conv_ls_cache_hits, _conv_ls_cache_misses
+    _conv_ls_cache.clear()
+    _conv_ls_cache_hits = _conv_ls_cache_misses = 0
+
+
+def _conv_ls_cache_key(filename, no_displacement):
+    inname_abs = os.path.normcase(common.z2rel_to_abs(filename))
+    try:
+        st = os.stat(inname_abs)
+    except OSError:
+        return (inname_abs, no_displacement, None, None)
+    return (inname_abs, no_displacement, st.st_mtime_ns, st.st_size)
+
 
-def conv_ls_elemente(f, num_elemente, filename):
-    outname_rel = common.z2rel_to_z3rel(filename)
+# Verschiebt alle Vertices (flache Liste x, y, z, x, y, z, ...) in den Mittelpunkt
+# ihres Rechtecks in der x/y-Ebene. Liefert die verschobenen Koordinaten, den
+# Mittelpunkt und das Quadrat des Bounding-Radius.
+def _vertices_lokal(werte):
+    if numpy is not None and werte:
+        vertices = numpy.array(werte).reshape(-1, 3)
+        x = vertices[:, 0]
+        y = vertices[:, 1]
+        centerx = (float(x.max()) + float(x.min())) / 2.0
+        centery = (float(y.max()) + float(y.min())) / 2.0
+        x -= centerx
+        y -= centery
+        boundingr_sq = max(0, float((x * x + y * y).max()))
+        return vertices.ravel().tolist(), centerx, centery, boundingr_sq
+
+    xs = werte[0::3]
+    ys = werte[1::3]
+    centerx = (max(xs, default=float("-inf")) + min(xs, default=float("+inf"))) / 2.0
+    centery = (max(ys, default=float("-inf")) + min(ys, default=float("+inf"))) / 2.0
+    lokal = werte.copy()
+    lokal[0::3] = xs = [x - centerx for x in xs]
+    lokal[1::3] = ys = [y - centery for y in ys]
+    boundingr_sq = max(0, max((x * x + y * y for x, y in zip(xs, ys)), default=0))
+    return lokal, centerx, centery, boundingr_sq
+
+
+def conv_ls_elemente(f, num_elemente, filename, no_displacement=False):
+    outname_rel = _elemente_name(filename, no_displacement)
     outname_abs = common.z3rel_to_abs(outname_rel)
     os.makedirs(os.path.dirname(outname_abs), exist_ok=True)
-    print(f" - conv_ls_elemente {filename} -> {outname_abs}", file=sys.stderr)
+    manifest.ausgabe(outname_abs)
+    protokoll.debug(" - conv_ls_elemente %s -> %s", filename, outname_abs)
     with open(outname_abs, "w") as fout2_ls:
         fout2_ls.write(f"2.3\r\n{num_elemente}\r\n#\r\n")
 
-        inhalt_boundingr_sq = 0
         elemente = []
-        min_x = float("+inf")
-        min_y = float("+inf")
-        max_x = float("-inf")
-        max_y = float("-inf")
+        werte = []  # Koordinaten aller Vertices
         for _ in range(num_elemente):
-            typ = int(f.readline().strip())
+            typ = f.next_int()
             if typ == 0:
                 # Lichtquelle
-                for _2 in range(11):
-                    f.readline()
+                f.skip(11)
             else:
-                f.readline()
-                vertices = []
-                for _2 in range(typ):
-                    x = readfloat(f)
-                    y = readfloat(f)
-                    max_x = max(max_x, x)
-                    max_y = max(max_y, y)
-                    min_x = min(min_x, x)
-                    min_y = min(min_y, y)
-                    z = readfloat(f)
-                    vertices.append((x, y, z))
-                c = int(f.readline().strip())
-                cnight = int(f.readline().strip())
-                blink = readfloatstr(f)
-                f.readline()
-                typ = int(f.readline().strip())
-                f.readline()
-                f.readline()
-                # elemente[c].append(vertices)
-                elemente.append((c, cnight, blink, typ, vertices))
-
-        centerx = (max_x + min_x) / 2.0
-        centery = (max_y + min_y) / 2.0
-
-        for c, cnight, blink, typ, vertices in elemente:
-            fout2_ls.write(f"{len(vertices)}\r\n#\r\n")
-            for x, y, z in vertices:
-                localx = x - centerx
-                localy = y - centery
-                inhalt_boundingr_sq = max(
-                    inhalt_boundingr_sq, localx * localx + localy * localy
-                )
-                fout2_ls.write(str(localx).replace(".", ","))
-                fout2_ls.write("\r\n")
-                fout2_ls.write(str(localy).replace(".", ","))
-                fout2_ls.write("\r\n")
-                fout2_ls.write(str(z).replace(".", ","))
+                f.skip()
+                anzahl = max(typ, 0)
+                werte += f.next_floats(3 * anzahl)
+                c = f.next_int()
+                cnight = f.next_int()
+                blink = f.next_floatstr()
+                f.skip()
+                typ = f.next_int()
+                f.skip(2)
+                elemente.append((c, cnight, blink, typ, anzahl))
+
+        werte, centerx, centery, inhalt_boundingr_sq = _vertices_lokal(werte)
+
+        pos = 0
+        for c, cnight, blink, typ, anzahl in elemente:
+            fout2_ls.write(f"{anzahl}\r\n#\r\n")
+            if anzahl:
+                ende = pos + 3 * anzahl
+                fout2_ls.write("\r\n".join(map(str, werte[pos:ende])).replace(".", ","))
                 fout2_ls.write("\r\n")
+                pos = ende
             fout2_ls.write(f"{c}\r\n{cnight}\r\n{blink}\r\n0\r\n{typ}\r\n#\r\n#\r\n")
-        print(
-            f" - #elemente={len(elemente)} {centerx=} {centery=} boundingr={math.sqrt(inhalt_boundingr_sq)}",
-            file=sys.stderr,
+        protokoll.debug(
+            " - #elemente=%s centerx=%r centery=%r boundingr=%s",
+            len(elemente),
+            centerx,
+            centery,
+            math.sqrt(inhalt_boundingr_sq),
         )
 
     return VerknParameter(
@@ -85,40 +124,258 @@ def conv_ls_elemente(f, num_elemente, filename):
     )
 
 
-def conv_ls(filename, no_displacement=False):
-    outname_rel = (
+# Die Elemente einer ls-Datei werden als eigene ls-Datei neben die .ls3-Datei
+# geschrieben, mit und ohne no_displacement getrennt, damit die beiden
+# Konvertierungen nicht gegenseitig ihre Ausgabe überschreiben.
+def _elemente_name(filename, no_displacement):
+    if not no_displacement:
+        return common.z2rel_to_z3rel(filename)
+    return common.z2rel_to_z3rel(filename)[:-3] + ".nd.ls"
+
+
+def ls3_name(filename, no_displacement=False):
+    return (
         common.z2rel_to_z3rel(filename)[:-3]
         + (".nd" if no_displacement else "")
         + ".ls3"
     )
+
+
+def conv_ls(filename, no_displacement=False):
+    global _conv_ls_cache_hits, _conv_ls_cache_misses
+
+    key = _conv_ls_cache_key(filename, no_displacement)
+    try:
+        result, aufzeichnung = _conv_ls_cache[key]
+    except KeyError:
+        pass
+    else:
+        _conv_ls_cache_hits += 1
+        manifest.melden(aufzeichnung)
+        return result
+
+    _conv_ls_cache_misses += 1
+    with manifest.aufzeichnung() as aufzeichnung:
+        if (result := _conv_ls_vorhanden(key, filename, no_displacement)) is None:
+            result = _conv_ls(filename, no_displacement)
+            manifest.store("ls", _manifest_key(key), aufzeichnung, result)
+    _conv_ls_cache[key] = (result, aufzeichnung)
+    return result
+
+
+def _manifest_key(key):
+    return f"{key[0]}|{int(key[1])}"
+
+
+# Liefert die VerknParameter einer bereits vorhandenen, aktuellen Ausgabedatei
+# oder None, wenn die Datei (neu) konvertiert werden muss.
+def _conv_ls_vorhanden(key, filename, no_displacement):
+    if (ergebnis := manifest.lookup("ls", _manifest_key(key))) is not None:
+        return VerknParameter(*ergebnis)
+
+    # Ohne Manifest: vorhandene Ausgabedatei wiederverwenden.
+    # Mit Manifest entscheidet das Manifest, ob neu konvertiert werden muss.
+    outname_rel = ls3_name(filename, no_displacement)
+    outname_abs = common.z3rel_to_abs(outname_rel)
+    if no_displacement and not manifest.aktiv() and os.path.exists(outname_abs):
+        protokoll.info("conv_ls %s -> %s", filename, outname_abs)
+        manifest.quelle(common.z2rel_to_abs(filename))
+        manifest.ausgabe(outname_abs)
+        return VerknParameter(
+            outname_rel, 0, 0, 0, 0, 0, 0, _boundingr_lesen(outname_abs)
+        )
+
+    return None
+
+
+# Berechnet den Bounding-Radius einer .nd.ls3-Datei aus ihren Verknüpfungen
+# genauso wie _conv_ls() (mit Mittelpunkt 0, 0), ohne den ganzen Baum zu laden.
+def _boundingr_lesen(outname_abs):
+    max_x = max_y = None
+    for _, node in ET.iterparse(outname_abs):
+        if node.tag == "p":
+            x = float(node.attrib["X"])
+            y = float(node.attrib["Y"])
+        elif node.tag == "Verknuepfte":
+            r = float(node.attrib["BoundingR"])
+            max_x = max(max_x or 0, abs(x + r), abs(x - r))
+            max_y = max(max_y or 0, abs(y + r), abs(y - r))
+        node.clear()
+    if max_x is None:
+        return 0
+    return math.sqrt(max_x * max_x + max_y * max_y)
+
+
+# Konvertiert mehrere ls-Dateien, gegeben als (Dateiname, no_displacement).
+# Mit jobs > 1 wird vorab der Graph aller verknüpften ls-Dateien ermittelt;
+# die Blätter werden parallel konvertiert, jede übergeordnete Datei, sobald
+# die VerknParameter aller ihrer verknüpften Dateien feststehen.
+#
+# fehler: dict, das den Fehler je Datei aufnimmt. Die übrigen Dateien werden
+# dann trotzdem konvertiert, statt beim ersten Fehler abzubrechen.
+def conv_ls_parallel(dateien, jobs=1, fehler=None):
+    dateien = list(dict.fromkeys(dateien))
+    if jobs > 1:
+        _conv_ls_graph(dateien, jobs, abbrechen=fehler is None)
+    if fehler is None:
+        return {datei: conv_ls(*datei) for datei in dateien}
+
+    ergebnisse = {}
+    for datei in dateien:
+        try:
+            ergebnisse[datei] = conv_ls(*datei)
+        except Exception as e:
+            fehler[datei] = e
+    return ergebnisse
+
+
+# Für Worker-Prozesse, die den conv_ls-Cache des Elternprozesses nicht per fork
+# erben oder das Manifest ignorieren (--force).
+def conv_ls_cache_eintraege():
+    return dict(_conv_ls_cache)
+
+
+def conv_ls_cache_uebernehmen(eintraege):
+    _conv_ls_cache.update(eintraege)
+
+
+def _ls_verknuepfungen(filename):
+    verknuepfungen = []
+    with common.Reader(common.z2rel_to_abs(filename)) as f:
+        f.skip(2)
+        while (datei := f.next_str()) != "#":
+            verknuepfungen.append(datei)
+            f.skip(6)
+    return verknuepfungen
+
+
+def _conv_ls_worker(filename, no_displacement, verknuepfte):
+    with manifest.aufzeichnung() as aufzeichnung:
+        result = _conv_ls(filename, no_displacement, verknuepfte)
+    return result, aufzeichnung, protokoll.abholen()
+
+
+# abbrechen=False: Dateien, die nicht konvertiert werden können, und alle, die
+# sie verknüpfen, werden ausgelassen; conv_ls() meldet danach ihren Fehler.
+def _conv_ls_graph(dateien, jobs, abbrechen=True):
+    global _conv_ls_cache_misses
+
+    # Noch zu konvertierende Dateien: key -> (Dateiname, no_displacement, {Verknüpfung: key})
+    knoten = {}
+    eltern = {}
+    stack = list(reversed(dateien))
+    while stack:
+        filename, no_displacement = stack.pop()
+        key = _conv_ls_cache_key(filename, no_displacement)
+        if key in knoten or key in _conv_ls_cache:
+            continue
+
+        with manifest.aufzeichnung() as aufzeichnung:
+            result = _conv_ls_vorhanden(key, filename, no_displacement)
+        if result is not None:
+            _conv_ls_cache_misses += 1
+            _conv_ls_cache[key] = (result, aufzeichnung)
+            continue
+
+        try:
+            verknuepfungen = _ls_verknuepfungen(filename)
+        except Exception:
+            if abbrechen:
+                raise
+            continue
+        kinder = {}
+        for datei in verknuepfungen:
+            kinder[datei] = _conv_ls_cache_key(datei, False)
+            eltern.setdefault(kinder[datei], []).append(key)
+            stack.append((datei, False))
+        knoten[key] = (filename, no_displacement, kinder)
+
+    offen = {
+        key: sum(1 for k in set(kinder.values()) if k not in _conv_ls_cache)
+        for key, (_, _, kinder) in knoten.items()
+    }
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=protokoll.worker_init,
+        initargs=(protokoll.stufe(),),
+    ) as executor:
+        laufend = {}
+
+        def starten(key):
+            filename, no_displacement, kinder = knoten[key]
+            verknuepfte = {
+                datei: _conv_ls_cache[k][0] for datei, k in kinder.items()
+            }
+            future = executor.submit(
+                _conv_ls_worker, filename, no_displacement, verknuepfte
+            )
+            laufend[future] = key
+
+        for key, anzahl in offen.items():
+            if anzahl == 0:
+                starten(key)
+
+        while laufend:
+            fertig, _ = concurrent.futures.wait(
+                laufend, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in fertig:
+                key = laufend.pop(future)
+                if not abbrechen and future.exception() is not None:
+                    continue
+                result, aufzeichnung, warnungen = future.result()
+                protokoll.melden(warnungen)
+                for k in set(knoten[key][2].values()):
+                    manifest.melden(_conv_ls_cache[k][1])
+                    aufzeichnung.quellen |= _conv_ls_cache[k][1].quellen
+                    aufzeichnung.ausgaben |= _conv_ls_cache[k][1].ausgaben
+                manifest.melden(aufzeichnung)
+                manifest.store("ls", _manifest_key(key), aufzeichnung, result)
+                _conv_ls_cache_misses += 1
+                _conv_ls_cache[key] = (result, aufzeichnung)
+
+                for elternkey in set(eltern.get(key, [])):
+                    if elternkey in offen:
+                        offen[elternkey] -= 1
+                        if offen[elternkey] == 0:
+                            starten(elternkey)
+
+    nicht_konvertiert = [key[0] for key in knoten if key not in _conv_ls_cache]
+    if nicht_konvertiert and abbrechen:
+        raise ValueError(
+            f"Zyklische Verknüpfung zwischen ls-Dateien: {', '.join(nicht_konvertiert)}"
+        )
+
+
+def _conv_ls(filename, no_displacement, verknuepfte=None):
+    outname_rel = ls3_name(filename, no_displacement)
     outname_abs = common.z3rel_to_abs(outname_rel)
-    print(f"conv_ls {filename} -> {outname_abs}", file=sys.stderr)
-    if no_displacement and os.path.exists(outname_abs):
-        boundingr = 0
-        with open(outname_abs) as f:
-            root = ET.parse(f)
-            for node in root.findall("Landschaft/Verknuepfte"):
-                boundingr = max(boundingr, float(node.attrib.get("BoundingR", 0)))
-        return VerknParameter(outname_rel, 0, 0, 0, 0, 0, 0, boundingr)
+    protokoll.info("conv_ls %s -> %s", filename, outname_abs)
+    manifest.quelle(common.z2rel_to_abs(filename))
+    manifest.ausgabe(outname_abs)
 
     os.makedirs(os.path.dirname(outname_abs), exist_ok=True)
     with open(outname_abs, "w") as fout:
         fout.write("<Zusi><Landschaft>\n")
 
         verknuepfungen = []
-        with open(common.z2rel_to_abs(filename), "r") as f:
-            f.readline()
-            num_elemente = int(f.readline().strip())
+        with common.Reader(common.z2rel_to_abs(filename)) as f:
+            f.skip()
+            num_elemente = f.next_int()
 
             # Verknüpfte ls-Dateien
-            while (datei := f.readline().strip()) != "#":
-                verknuepfung = conv_ls(datei)
-                x = readfloat(f)
-                y = readfloat(f)
-                z = readfloat(f)
-                rx = readfloat(f)
-                ry = readfloat(f)
-                rz = readfloat(f)
+            while (datei := f.next_str()) != "#":
+                if verknuepfte is not None:
+                    verknuepfung = verknuepfte[datei]
+                else:
+                    verknuepfung = conv_ls(datei)
+                x = f.next_float()
+                y = f.next_float()
+                z = f.next_float()
+                rx = f.next_float()
+                ry = f.next_float()
+                rz = f.next_float()
 
                 # https://stackoverflow.com/questions/14607640/rotating-a-vector-in-3d-space
                 # In 3D rotating around the Z-axis would be
@@ -172,11 +429,14 @@ def conv_ls(filename, no_displacement=False):
             # Inhalt der ls-Datei
             if num_elemente != 0:
                 # liest den Rest von f
-                verknuepfungen.append(conv_ls_elemente(f, num_elemente, filename))
+                verknuepfungen.append(
+                    conv_ls_elemente(f, num_elemente, filename, no_displacement)
+                )
 
-        print(f"conv_ls {filename}: verknuepfungen:", file=sys.stderr)
-        for verkn in verknuepfungen:
-            print(f" - {verkn}", file=sys.stderr)
+        if protokoll.aktiv(protokoll.DEBUG):
+            protokoll.debug("conv_ls %s: verknuepfungen:", filename)
+            for verkn in verknuepfungen:
+                protokoll.debug(" - %s", verkn)
 
         if not len(verknuepfungen) or no_displacement:
             centerx = centery = 0
@@ -215,7 +475,9 @@ def conv_ls(filename, no_displacement=False):
         else:
             boundingr = 0
 
-        print(f"{centerx=} {centery=} {boundingr=}", file=sys.stderr)
+        protokoll.debug(
+            "centerx=%r centery=%r boundingr=%r", centerx, centery, boundingr
+        )
         fout.write("</Landschaft></Zusi>")
 
         return VerknParameter(outname_rel, centerx, centery, 0, 0, 0, 0, boundingr)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Persistentes Verzeichnis der bereits konvertierten Dateien, damit ein erneuter
+# Lauf nur die Dateien konvertiert, deren Quellen sich seitdem geändert haben.
+#
+# Jeder Eintrag enthält alle Quelldateien, die bei der Konvertierung gelesen wurden
+# (mit mtime, Größe und SHA-1), alle geschriebenen Ausgabedateien (mit mtime und
+# Größe) und das Ergebnis der Konvertierung (z.B. die VerknParameter einer ls-Datei).
+
+import contextlib
+import hashlib
+import json
+import os
+
+from . import common, protokoll
+
+MANIFEST_REL = r"Temp\_z2conv\manifest.json"
+# Erhöhen, wenn sich der Aufbau der Einträge oder eines gespeicherten Ergebnisses
+# ändert, damit alte Einträge verworfen statt falsch gelesen werden.
+MANIFEST_VERSION = 3
+
+_eintraege = None  # None: Manifest nicht geladen, keine Buchführung
+_geaendert = False
+_aufzeichnungen = []
+_sha1_cache = {}
+_neu = set()  # seit dem letzten abholen() gespeicherte Schlüssel
+
+
+class Aufzeichnung:
+    def __init__(self):
+        self.quellen = set()
+        self.ausgaben = set()
+
+
+def load(ignorieren=False):
+    global _eintraege, _geaendert
+    _eintraege = {}
+    _geaendert = False
+    _neu.clear()
+    if ignorieren:
+        return
+    try:
+        with open(common.z3rel_to_abs(MANIFEST_REL), "r", encoding="utf-8") as f:
+            daten = json.load(f)
+    except (OSError, ValueError):
+        return
+    if daten.get("version") == MANIFEST_VERSION:
+        _eintraege = daten["eintraege"]
+
+
+def save():
+    if _eintraege is None or not _geaendert:
+        return
+    manifest_abs = common.z3rel_to_abs(MANIFEST_REL)
+    os.makedirs(os.path.dirname(manifest_abs), exist_ok=True)
+    with open(manifest_abs + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "eintraege": _eintraege}, f)
+    os.replace(manifest_abs + ".tmp", manifest_abs)
+
+
+def aktiv():
+    return _eintraege is not None
+
+
+def quelle(pfad):
+    for aufzeichnung in _aufzeichnungen:
+        aufzeichnung.quellen.add(pfad)
+
+
+def ausgabe(pfad):
+    for aufzeichnung in _aufzeichnungen:
+        aufzeichnung.ausgaben.add(pfad)
+
+
+# Meldet Quellen und Ausgaben einer früheren Aufzeichnung erneut,
+# z.B. wenn das Ergebnis aus einem Cache kommt.
+def melden(aufzeichnung):
+    for a in _aufzeichnungen:
+        a.quellen |= aufzeichnung.quellen
+        a.ausgaben |= aufzeichnung.ausgaben
+
+
+@contextlib.contextmanager
+def aufzeichnung():
+    a = Aufzeichnung()
+    _aufzeichnungen.append(a)
+    try:
+        yield a
+    finally:
+        _aufzeichnungen.remove(a)
+        # Verschachtelte Konvertierungen gehören auch zur umgebenden Konvertierung.
+        for aussen in _aufzeichnungen:
+            aussen.quellen |= a.quellen
+            aussen.ausgaben |= a.ausgaben
+
+
+def _sha1(pfad):
+    h = hashlib.sha1()
+    with open(pfad, "rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _fingerabdruck(pfad):
+    st = os.stat(pfad)
+    key = (pfad, st.st_mtime_ns, st.st_size)
+    if (sha1 := _sha1_cache.get(key)) is None:
+        sha1 = _sha1_cache[key] = _sha1(pfad)
+    return [st.st_mtime_ns, st.st_size, sha1]
+
+
+def sha1(pfad):
+    return _fingerabdruck(pfad)[2]
+
+
+def _quelle_unveraendert(pfad, fingerabdruck):
+    global _geaendert
+    mtime, groesse, sha1 = fingerabdruck
+    try:
+        st = os.stat(pfad)
+    except OSError:
+        return False
+    if st.st_size != groesse:
+        return False
+    if st.st_mtime_ns == mtime:
+        return True
+    # Nur der Zeitstempel hat sich geändert (z.B. durch erneutes Auspacken)?
+    if _sha1(pfad) != sha1:
+        return False
+    fingerabdruck[0] = st.st_mtime_ns
+    _geaendert = True
+    return True
+
+
+def _ausgabe_unveraendert(pfad, fingerabdruck):
+    try:
+        st = os.stat(pfad)
+    except OSError:
+        return False
+    return [st.st_mtime_ns, st.st_size] == fingerabdruck
+
+
+# Liefert das gespeicherte Ergebnis, falls sich keine Quelle geändert hat
+# und alle Ausgabedateien noch so existieren, wie sie geschrieben wurden, sonst None.
+def lookup(art, schluessel):
+    if _eintraege is None:
+        return None
+    eintrag = _eintraege.get(f"{art}:{schluessel}")
+    if eintrag is None:
+        return None
+    if not all(
+        _ausgabe_unveraendert(pfad, fingerabdruck)
+        for pfad, fingerabdruck in eintrag["ausgaben"].items()
+    ):
+        return None
+    if not all(
+        _quelle_unveraendert(pfad, fingerabdruck)
+        for pfad, fingerabdruck in eintrag["quellen"].items()
+    ):
+        return None
+
+    for aufzeichnung in _aufzeichnungen:
+        aufzeichnung.quellen.update(eintrag["quellen"])
+        aufzeichnung.ausgaben.update(eintrag["ausgaben"])
+    return eintrag["ergebnis"]
+
+
+def store(art, schluessel, aufzeichnung, ergebnis):
+    global _geaendert
+    if _eintraege is None:
+        return
+    try:
+        quellen = {pfad: _fingerabdruck(pfad) for pfad in sorted(aufzeichnung.quellen)}
+        ausgaben = {}
+        for pfad in sorted(aufzeichnung.ausgaben):
+            st = os.stat(pfad)
+            ausgaben[pfad] = [st.st_mtime_ns, st.st_size]
+    except OSError as e:
+        protokoll.warnung(
+            "nicht gespeicherte Manifesteinträge",
+            "Manifest: %s %s nicht gespeichert: %s",
+            art,
+            schluessel,
+            e,
+        )
+        return
+    _eintraege[f"{art}:{schluessel}"] = {
+        "quellen": quellen,
+        "ausgaben": ausgaben,
+        "ergebnis": ergebnis,
+    }
+    _neu.add(f"{art}:{schluessel}")
+    _geaendert = True
+
+
+# Für Worker-Prozesse. Mit fork ist das Manifest des Elternprozesses schon
+# geladen, seine neuen Einträge hat der Elternprozess selbst.
+def worker_init(ignorieren):
+    if not aktiv():
+        load(ignorieren)
+    _neu.clear()
+
+
+# Für Worker-Prozesse: liefert die seit dem letzten Aufruf gespeicherten
+# Einträge, die der Elternprozess mit uebernehmen() in sein Manifest übernimmt.
+def abholen():
+    if _eintraege is None:
+        return {}
+    eintraege = {schluessel: _eintraege[schluessel] for schluessel in _neu}
+    _neu.clear()
+    return eintraege
+
+
+def uebernehmen(eintraege):
+    global _geaendert
+    if _eintraege is None or not eintraege:
+        return
+    _eintraege.update(eintraege)
+    _geaendert = True
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Laufzeitmessung der Konvertierung nach Phasen (--profile).
+#
+# Für jede Phase werden Wall- und CPU-Zeit summiert, und zwar ohne die Zeit
+# darin verschachtelter Phasen, sowie der höchste bis zum Ende der Phase
+# erreichte Speicherbedarf (Peak RSS, nur wo das Modul resource verfügbar ist).
+# Für die Fahrstraßensuche wird zusätzlich jedes Startsignal einzeln erfasst.
+
+import contextlib
+import json
+import sys
+import time
+
+from . import protokoll
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_aktiv = False
+_phasen = {}
+_stapel = []  # [Name, Wall-Start, CPU-Start, Wall der Unterphasen, CPU der Unterphasen]
+_starts = []
+
+
+def start():
+    global _aktiv
+    _aktiv = True
+    _phasen.clear()
+    _stapel.clear()
+    _starts.clear()
+
+
+def aktiv():
+    return _aktiv
+
+
+def _neue_phase(name):
+    return _phasen.setdefault(
+        name, {"wall": 0.0, "cpu": 0.0, "aufrufe": 0, "peak_rss": None}
+    )
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KiB, macOS: Bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def beginn(name):
+    if _aktiv:
+        _stapel.append([name, time.perf_counter(), time.process_time(), 0.0, 0.0])
+
+
+def ende(name):
+    if not _aktiv:
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    name2, wall0, cpu0, wall_unter, cpu_unter = _stapel.pop()
+    assert name2 == name, f"Phase {name} beendet, aber {name2} läuft"
+    wall -= wall0
+    cpu -= cpu0
+    if _stapel:
+        _stapel[-1][3] += wall
+        _stapel[-1][4] += cpu
+
+    phase = _neue_phase(name)
+    phase["wall"] += wall - wall_unter
+    phase["cpu"] += cpu - cpu_unter
+    phase["aufrufe"] += 1
+    phase["peak_rss"] = _peak_rss()
+
+
+@contextlib.contextmanager
+def phase(name):
+    beginn(name)
+    try:
+        yield
+    finally:
+        ende(name)
+
+
+# Für Worker-Prozesse: liefert die seit dem letzten Aufruf gemessenen Phasen und
+# Startsignale, die der Elternprozess mit uebernehmen() in seine Messung übernimmt.
+def abholen():
+    daten = {"phasen": dict(_phasen), "starts": list(_starts)}
+    _phasen.clear()
+    _starts.clear()
+    return daten
+
+
+def uebernehmen(daten):
+    for name, p in daten["phasen"].items():
+        phase = _neue_phase(name)
+        phase["wall"] += p["wall"]
+        phase["cpu"] += p["cpu"]
+        phase["aufrufe"] += p["aufrufe"]
+        if p["peak_rss"] is not None:
+            phase["peak_rss"] = max(phase["peak_rss"] or 0, p["peak_rss"])
+    _starts.extend(daten["starts"])
+
+
+# Eine Fahrstraßensuche ab einem Startsignal oder Aufgleispunkt
+def fahrstrassen_start(
+    elem_nr, beschreibung, betriebsstelle, wall, cpu, gefunden, abgebrochen, gekuerzt
+):
+    if _aktiv:
+        _starts.append(
+            {
+                "element": elem_nr,
+                "beschreibung": beschreibung,
+                "betriebsstelle": betriebsstelle,
+                "wall": wall,
+                "cpu": cpu,
+                "gefunden": gefunden,
+                "abgebrochen": abgebrochen,
+                "gekuerzt": gekuerzt,
+            }
+        )
+
+
+def bericht():
+    betriebsstellen = {}
+    for s in _starts:
+        b = betriebsstellen.setdefault(
+            s["betriebsstelle"],
+            {
+                "wall": 0.0,
+                "cpu": 0.0,
+                "starts": 0,
+                "gefunden": 0,
+                "abgebrochen": 0,
+                "gekuerzt": 0,
+            },
+        )
+        b["wall"] += s["wall"]
+        b["cpu"] += s["cpu"]
+        b["starts"] += 1
+        b["gefunden"] += s["gefunden"]
+        b["abgebrochen"] += s["abgebrochen"]
+        b["gekuerzt"] += s["gekuerzt"]
+
+    return {
+        "phasen": _phasen,
+        "peak_rss": _peak_rss(),
+        "warnungen": protokoll.warnungen(),
+        "fahrstrassen": {
+            "gefunden": sum(s["gefunden"] for s in _starts),
+            "abgebrochen": sum(s["abgebrochen"] for s in _starts),
+            "gekuerzt": sum(s["gekuerzt"] for s in _starts),
+            "starts": sorted(_starts, key=lambda s: s["wall"], reverse=True),
+            "betriebsstellen": dict(
+                sorted(
+                    betriebsstellen.items(), key=lambda b: b[1]["wall"], reverse=True
+                )
+            ),
+        },
+    }
+
+
+def save(pfad):
+    with open(pfad, "w", encoding="utf-8") as f:
+        json.dump(bericht(), f, indent=2, ensure_ascii=False)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Ausgaben der Konvertierung auf stderr, nach Stufen gefiltert.
+#
+# Warnungen werden unabhängig von der Stufe je Art gezählt. Mit --quiet werden
+# sie nicht einzeln ausgegeben, sondern am Ende nur zusammengefasst. Meldungen
+# werden erst formatiert (text % args), wenn sie tatsächlich ausgegeben werden.
+
+import collections
+import sys
+
+DEBUG = 10
+INFO = 20
+WARNUNG = 30
+FEHLER = 40
+
+_stufe = INFO
+_warnungen = collections.Counter()
+
+
+def set_stufe(stufe):
+    global _stufe
+    _stufe = stufe
+
+
+def stufe():
+    return _stufe
+
+
+def aktiv(stufe):
+    return stufe >= _stufe
+
+
+# Text und Zeilenende in einem Aufruf, damit sich die Zeilen mehrerer
+# Worker-Prozesse nicht vermischen.
+def _ausgeben(text, args):
+    sys.stderr.write((text % args if args else text) + "\n")
+
+
+def debug(text, *args):
+    if DEBUG >= _stufe:
+        _ausgeben(text, args)
+
+
+def info(text, *args):
+    if INFO >= _stufe:
+        _ausgeben(text, args)
+
+
+# art: kurze Beschreibung für die Zusammenfassung
+def warnung(art, text, *args):
+    _warnungen[art] += 1
+    if WARNUNG >= _stufe:
+        _ausgeben(text, args)
+
+
+def fehler(text, *args):
+    if FEHLER >= _stufe:
+        _ausgeben(text, args)
+
+
+def warnungen():
+    return dict(_warnungen.most_common())
+
+
+# Initializer für Worker-Prozesse. Mit fork erbt der Worker die bisherigen
+# Zähler des Elternprozesses, die dort schon gezählt sind.
+def worker_init(stufe):
+    set_stufe(stufe)
+    _warnungen.clear()
+
+
+# Für Worker-Prozesse: liefert die seit dem letzten Aufruf gezählten Warnungen,
+# die der Elternprozess mit melden() übernimmt.
+def abholen():
+    ergebnis = dict(_warnungen)
+    _warnungen.clear()
+    return ergebnis
+
+
+def melden(warnungen):
+    _warnungen.update(warnungen)
+
+
+def zusammenfassung(bericht=None):
+    if not _warnungen:
+        return
+    verweis = f", siehe {bericht}" if bericht else ""
+    for art, anzahl in _warnungen.most_common():
+        anzahl = f"{anzahl:,}".replace(",", ".")
+        print(f"{anzahl} × {art}{verweis}", file=sys.stderr)
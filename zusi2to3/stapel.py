@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Stapelkonvertierung (--batch): alle Strecken und Fahrpläne unterhalb eines
+# Verzeichnisses oder aus einer Listendatei in einem Lauf.
+#
+# Jeder Fahrplan gehört zu der Streckendatei im nächstgelegenen übergeordneten
+# Verzeichnis. Die Strecken werden mit jobs > 1 in Worker-Prozessen konvertiert;
+# ein Worker behält den conv_ls-Cache über alle seine Strecken, so dass gemeinsam
+# genutzte Landschafts- und Signaldateien nicht für jede Strecke neu konvertiert
+# werden. Die ls-Dateien aller Strecken konvertiert vorab der Elternprozess, damit
+# nicht zwei Worker gleichzeitig dieselben .ls3-Dateien schreiben. Die Worker
+# liefern ihre Manifesteinträge, Warnungen und Messwerte (--profile) an den
+# Elternprozess zurück, der das Manifest am Ende einmal speichert.
+
+import concurrent.futures
+import os
+import time
+import traceback
+from collections import namedtuple
+
+from . import common, fahrplan, landschaft, manifest, profil, protokoll, strecke
+
+Ergebnis = namedtuple(
+    "Ergebnis", ["strname", "fpnnames", "fehler", "dauer", "warnungen"]
+)
+
+
+def _dateien(pfad):
+    if os.path.isdir(pfad):
+        for verzeichnis, unterverzeichnisse, dateinamen in os.walk(pfad):
+            unterverzeichnisse.sort()
+            for dateiname in sorted(dateinamen):
+                yield os.path.join(verzeichnis, dateiname)
+    else:
+        yield pfad
+
+
+# Listendatei: ein Pfad (Datei oder Verzeichnis) je Zeile, relativ zu
+# ZUSI2_DATAPATH oder absolut. Leere Zeilen und Zeilen mit "#" werden ignoriert.
+def _liste(pfad):
+    with open(pfad, encoding="utf-8") as f:
+        for zeile in f:
+            if (zeile := zeile.strip()) and not zeile.startswith("#"):
+                yield from _dateien(common.z2rel_to_abs(zeile))
+
+
+def _streckendateien(verzeichnis, cache):
+    if (ergebnis := cache.get(verzeichnis)) is None:
+        try:
+            namen = sorted(os.listdir(verzeichnis))
+        except OSError:
+            namen = []
+        ergebnis = cache[verzeichnis] = [
+            os.path.join(verzeichnis, name)
+            for name in namen
+            if name.lower().endswith(".str")
+        ]
+    return ergebnis
+
+
+# Liefert {Streckendatei: [Fahrpläne]} und die Fahrpläne, zu denen keine
+# eindeutige Streckendatei gefunden wurde, als {Fahrplan: Meldung}.
+def finden(pfad):
+    pfad = common.z2rel_to_abs(pfad)
+    dateien = _dateien(pfad) if os.path.isdir(pfad) else _liste(pfad)
+
+    strecken = {}
+    fahrplaene = []
+    for datei in dateien:
+        endung = os.path.splitext(datei)[1].lower()
+        if endung == ".str":
+            strecken.setdefault(os.path.normpath(datei), [])
+        elif endung == ".fpn":
+            fahrplaene.append(os.path.normpath(datei))
+
+    wurzel = os.path.normpath(common.Z2ABS)
+    cache = {}
+    ohne_strecke = {}
+    for fpnname in dict.fromkeys(fahrplaene):
+        verzeichnis = os.path.dirname(fpnname)
+        while not (kandidaten := _streckendateien(verzeichnis, cache)):
+            if verzeichnis == wurzel or os.path.dirname(verzeichnis) == verzeichnis:
+                break
+            verzeichnis = os.path.dirname(verzeichnis)
+        if len(kandidaten) == 1:
+            strecken.setdefault(kandidaten[0], []).append(fpnname)
+        elif kandidaten:
+            ohne_strecke[fpnname] = (
+                f"mehrere Streckendateien in {verzeichnis}, Zuordnung nicht eindeutig"
+            )
+        else:
+            ohne_strecke[fpnname] = "keine Streckendatei gefunden"
+    return strecken, ohne_strecke
+
+
+def _konvertieren(strname, fpnnames, jobs, grenzen, trn_dateien):
+    bisher = protokoll.abholen()
+    fehler = []
+    start = time.perf_counter()
+    try:
+        st3_name, rekursionstiefe = strecke.conv_str(
+            strname, jobs=jobs, grenzen=grenzen
+        )
+    except Exception as e:
+        protokoll.debug("%s", traceback.format_exc())
+        fehler.append(f"{_name(strname)}: {e}")
+    else:
+        schnappschuss = strecke.schnappschuss(strname, grenzen)
+        for fpnname in fpnnames:
+            try:
+                bezuege = fahrplan.conv_fpn(
+                    fpnname, st3_name, rekursionstiefe, jobs, trn_dateien
+                )
+                fahrplan.pruefen(fpnname, bezuege, schnappschuss)
+            except Exception as e:
+                protokoll.debug("%s", traceback.format_exc())
+                fehler.append(f"{_name(fpnname)}: {e}")
+    dauer = time.perf_counter() - start
+    warnungen = protokoll.abholen()
+    protokoll.melden(bisher)
+    return Ergebnis(strname, fpnnames, fehler, dauer, warnungen)
+
+
+def _init_worker(stufe, ignorieren, profilieren, ls_cache):
+    protokoll.worker_init(stufe)
+    manifest.worker_init(ignorieren)
+    landschaft.conv_ls_cache_uebernehmen(ls_cache)
+    if profilieren:
+        profil.start()
+
+
+def _worker(strname, fpnnames, grenzen, trn_dateien):
+    ergebnis = _konvertieren(strname, fpnnames, 1, grenzen, trn_dateien)
+    return ergebnis, manifest.abholen(), profil.abholen()
+
+
+# Konvertiert die ls-Dateien aller Strecken und liefert die Einträge des
+# conv_ls-Caches für die Worker. Eine fehlerhafte ls-Datei betrifft nur die
+# Strecken, die sie verwenden; deren Konvertierung meldet dann den Fehler.
+def _ls_dateien_konvertieren(strnamen, jobs):
+    dateien = []
+    for strname in strnamen:
+        try:
+            dateien += [(datei, True) for datei in strecke.ls_dateien(strname)]
+        except OSError:
+            pass
+    fehler = {}
+    with profil.phase("landschaft"):
+        landschaft.conv_ls_parallel(dateien, jobs, fehler)
+    for (datei, _), e in fehler.items():
+        protokoll.warnung(
+            "nicht vorab konvertierte ls-Dateien",
+            "%s nicht vorab konvertiert: %s",
+            datei,
+            e,
+        )
+    return landschaft.conv_ls_cache_eintraege()
+
+
+# Liefert die Ergebnisse in der Reihenfolge der Streckendateien.
+def konvertieren(
+    strecken,
+    jobs=1,
+    ignorieren=False,
+    grenzen=strecke.Suchgrenzen(),
+    trn_dateien=False,
+):
+    if jobs <= 1 or len(strecken) <= 1:
+        ergebnisse = [
+            _konvertieren(strname, fpnnames, jobs, grenzen, trn_dateien)
+            for strname, fpnnames in strecken.items()
+        ]
+    else:
+        ls_cache = _ls_dateien_konvertieren(strecken, jobs)
+        ergebnisse = {}
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(protokoll.stufe(), ignorieren, profil.aktiv(), ls_cache),
+        ) as executor:
+            # Große Strecken zuerst, damit am Ende keine einzelne übrig bleibt.
+            futures = [
+                executor.submit(
+                    _worker, strname, strecken[strname], grenzen, trn_dateien
+                )
+                for strname in sorted(strecken, key=os.path.getsize, reverse=True)
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                ergebnis, eintraege, messung = future.result()
+                manifest.uebernehmen(eintraege)
+                profil.uebernehmen(messung)
+                ergebnisse[ergebnis.strname] = ergebnis
+        ergebnisse = [ergebnisse[strname] for strname in strecken]
+
+    for ergebnis in ergebnisse:
+        protokoll.melden(ergebnis.warnungen)
+    return ergebnisse
+
+
+def _name(pfad):
+    return os.path.relpath(pfad, common.Z2ABS).replace(os.sep, "\\")
+
+
+def zusammenfassung(ergebnisse, ohne_strecke):
+    for ergebnis in ergebnisse:
+        anzahl_warnungen = sum(ergebnis.warnungen.values())
+        status = "FEHLER" if ergebnis.fehler else "ok"
+        print(
+            f"{_name(ergebnis.strname)}: {status}, {len(ergebnis.fpnnames)} Fahrpläne, "
+            f"{ergebnis.dauer:.2f} s, {anzahl_warnungen} Warnungen"
+        )
+        for meldung in ergebnis.fehler:
+            print(f"  {meldung}")
+    for fpnname, meldung in ohne_strecke.items():
+        print(f"{_name(fpnname)}: FEHLER, {meldung}")
+
+    fehlgeschlagen = sum(1 for ergebnis in ergebnisse if ergebnis.fehler)
+    print(
+        f"{len(ergebnisse)} Strecken, davon {fehlgeschlagen} mit Fehlern; "
+        f"{len(ohne_strecke)} Fahrpläne ohne Strecke"
+    )
+    return fehlgeschlagen == 0 and not ohne_strecke
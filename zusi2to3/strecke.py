@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
-import copy
+import concurrent.futures
+import contextlib
 import enum
 import os
 import math
+import pickle
+import tempfile
+import time
 import xml.etree.ElementTree as ET
 from collections import defaultdict, namedtuple
 
-from . import common, landschaft
-from .common import readfloat, readfloatstr
+from . import common, gleisgraph, landschaft, manifest, profil, protokoll
 
 
 class RefTyp(enum.IntEnum):
@@ -48,6 +50,22 @@ VerknParameter = namedtuple(
 
 
 class Signal:
+    __slots__ = (
+        "elnr",
+        "block",
+        "gleis",
+        "matrix",
+        "vsig_geschw",
+        "hsig_geschw",
+        "vsigs",
+        "anzahl_sigframes",
+        "zeilen",
+        "zeile_v0",
+        "hsig_spalte",
+        "vsig_spalten",
+        "vsig_spalten_kleiner",
+    )
+
     def __init__(self):
         self.elnr = 0
         self.block = ""
@@ -58,8 +76,36 @@ class Signal:
         self.vsigs = []
         self.anzahl_sigframes = 0
 
+    # Nachschlagetabellen für die Fahrstraßensuche, nach dem Einlesen aufzubauen:
+    #  zeilen: (Block, Gleis) des Ziels -> erste passende Matrixzeile
+    #  zeile_v0: erste Matrixzeile mit vmax == 0 (None, falls keine)
+    #  hsig_spalte: Spalte der Hauptsignalbegriffe (erste mit Vsig-Geschw. 0)
+    #  vsig_spalten: (Vsig-Geschw., ID) -> Spalte, ID zählt gleiche Geschw.
+    #  vsig_spalten_kleiner: Vsig-Geschw. -> Spalte mit der höchsten kleineren
+    #    Geschwindigkeit, wird bei Bedarf gefüllt
+    def index_aufbauen(self):
+        self.zeilen = {}
+        self.zeile_v0 = None
+        for idx, mz in enumerate(self.matrix):
+            self.zeilen.setdefault((mz.block, mz.gleis), idx)
+            if mz.vmax == 0 and self.zeile_v0 is None:
+                self.zeile_v0 = idx
+
+        self.hsig_spalte = 0
+        self.vsig_spalten = {}
+        anzahl = {}
+        for idx, vsig_geschw in enumerate(self.vsig_geschw):
+            if vsig_geschw == 0 and not anzahl.get(0):
+                self.hsig_spalte = idx
+            ID = anzahl.get(vsig_geschw, 0)
+            self.vsig_spalten[(vsig_geschw, ID)] = idx
+            anzahl[vsig_geschw] = ID + 1
+        self.vsig_spalten_kleiner = {}
+
 
 class MatrixZeile:
+    __slots__ = ("block", "gleis", "vmax", "spalten")
+
     def __init__(self):
         self.block = ""
         self.gleis = ""
@@ -68,6 +114,8 @@ class MatrixZeile:
 
 
 class MatrixEintrag:
+    __slots__ = ("bild", "vmax", "id", "er1", "er2")
+
     def __init__(self):
         self.bild = 0
         self.vmax = 0
@@ -213,799 +261,1279 @@ def conv_ereignis(er_nr, parent_node):
         pass
 
 
-def conv_str(strname):
-    elements = {}
-    nodes = {}
-    signale = {}
-    anonymesignale = {}
-    fahrstrsignale = set()
-    regnr = 20000  # TODO
+# Fahrstraßen
 
-    n_root = ET.Element("Zusi")
-    tree = ET.ElementTree(n_root)
-    n_strecke = ET.SubElement(n_root, "Strecke")
 
-    f = open(strname, "r", encoding="iso-8859-1")
-    inname_rel = os.path.relpath(f.name[:-1] + "3", common.Z2ABS).replace(os.sep, "\\")
-    outname_rel = common.z2rel_to_z3rel(inname_rel)
+def v_kleiner(v1, v2):
+    if v2 == -1:
+        return True
+    elif v1 == -1:
+        return False
+    else:
+        return v1 < v2
 
-    zusiversion = f.readline().strip()
-    if zusiversion != "2.3":
-        print("Version", zusiversion, "wird nicht gelesen")
-        sys.exit()
 
-    for i in range(0, 2):
-        f.readline()
+def get_vsig_spalte(sig, v, ID):
+    if (spalte := sig.vsig_spalten.get((v, ID))) is not None:
+        return spalte
+    if (spalte := sig.vsig_spalten_kleiner.get(v)) is not None:
+        return spalte
+
+    spalte = 0
+    spalte_geschw = -1
+    for idx, vsig_geschw in enumerate(sig.vsig_geschw):
+        if v != 0 and vsig_geschw != 0:
+            if v_kleiner(vsig_geschw, v):
+                if vsig_geschw > spalte_geschw:
+                    spalte = idx
+                    spalte_geschw = vsig_geschw
+
+    sig.vsig_spalten_kleiner[v] = spalte
+    return spalte
+
+
+# Eine gefundene Fahrstraße mit ihren Einträgen (Tag, Attribute) in Reihenfolge.
+# Während der Suche wird der Fahrweg als unveränderliche, verkettete Liste
+# (vorheriger Pfad, Tupel von (Tag, Attribute)) aufgebaut, sodass sich alle
+# Fahrstraßen, die sich erst an einer Weiche trennen, den gemeinsamen Anfang
+# teilen, und zwischengespeicherte Abschnitte ohne Kopie angehängt werden.
+# Das XML entsteht erst beim Schreiben in FahrstrassenXml.
+Fahrstrasse = namedtuple("Fahrstrasse", ["name", "eintraege"])
+
+
+def pfad_eintraege(pfad):
+    teile = []
+    while pfad is not None:
+        pfad, eintraege = pfad
+        teile.append(eintraege)
+    teile.reverse()
+    return [eintrag for eintraege in teile for eintrag in eintraege]
+
+
+# Serialisiert Fahrstraßen für St3Writer.write(). Die Einträge wiederholen sich
+# über die Fahrstraßen einer Strecke sehr oft, ihr XML (mit dem immer gleichen
+# Datei-Kindelement) wird daher je verschiedenem Eintrag nur einmal erzeugt.
+class FahrstrassenXml:
+    def __init__(self, outname_rel):
+        self.datei = {"Dateiname": outname_rel, "NurInfo": "1"}
+        self.cache = {}
+        self.namen = set()  # für den Schnappschuss
+
+    def eintrag(self, tag, attrib):
+        # Die Attributnamen sind je Tag immer dieselben.
+        key = (tag, *attrib.values())
+        if (text := self.cache.get(key)) is None:
+            n_eintrag = ET.Element(tag, attrib)
+            ET.SubElement(n_eintrag, "Datei", self.datei)
+            text = self.cache[key] = ET.tostring(n_eintrag, encoding="unicode")
+        return text
+
+    def __call__(self, fahrstrasse):
+        self.namen.add(fahrstrasse.name)
+        kopf = ET.tostring(
+            ET.Element(
+                "Fahrstrasse", {"FahrstrName": fahrstrasse.name, "FahrstrTyp": "TypZug"}
+            ),
+            encoding="unicode",
+        )
+        return "".join(
+            [
+                kopf[: -len(" />")] + ">",
+                *(self.eintrag(tag, attrib) for tag, attrib in fahrstrasse.eintraege),
+                "</Fahrstrasse>",
+            ]
+        )
 
-    rekursionstiefe = int(f.readline())
 
-    for i in range(0, 2):
-        while not f.readline().startswith("#"):
-            pass
+# Grenzen der Fahrstraßensuche, damit fehlerhafte Streckendaten die Suche nicht
+# beliebig lange laufen lassen:
+#  max_tiefe: Streckenelemente je Fahrweg (auch beim Suchen der Auflösepunkte)
+#  max_fahrstrassen: Fahrstraßen (und Abschnitte) je Startsignal
+#  max_weichen: befahrene Weichen je Fahrweg
+Suchgrenzen = namedtuple(
+    "Suchgrenzen",
+    ["max_tiefe", "max_fahrstrassen", "max_weichen"],
+    defaults=[100000, 10000, 100],
+)
 
-    f.readline()
-    ls_datei = f.readline().strip()
+# Ende eines Abschnitts ohne Zielsignal
+STRECKENENDE = -1
+KREISFAHRT = -5  # Gleiskreis ohne Hauptsignal ein zweites Mal erreicht
+GRENZE_TIEFE = -2
+GRENZE_FAHRSTRASSEN = -3
+GRENZE_WEICHEN = -4
+
+_GRENZEN = {
+    GRENZE_TIEFE: "max. Tiefe",
+    GRENZE_FAHRSTRASSEN: "max. Fahrstraßen",
+    GRENZE_WEICHEN: "max. Weichen",
+}
+
+
+# Die Fahrstraßensuche setzt jeden Fahrweg aus Abschnitten zusammen, die jeweils
+# von einem Signal (oder Aufgleispunkt) bis zum nächsten Signal bzw. Streckenende
+# führen. Die Abschnitte ab einem Element und die Auflösepunkte hinter einem
+# Zielsignal hängen nur vom Gleisgraphen ab und werden je Element nur einmal
+# ermittelt, auch wenn viele Startsignale dasselbe Zwischen- oder Zielsignal
+# erreichen.
+#
+# Alle Suchen arbeiten mit einem expliziten Stapel statt mit Rekursion und
+# halten die Reihenfolge der Weichenlagen ein. Wird eine der Suchgrenzen
+# erreicht, wird der betroffene Fahrweg verworfen und die Suche als gekürzt
+# gemeldet.
+class Fahrstrassensuche:
+    def __init__(self, graph, signale, anonymesignale, grenzen=Suchgrenzen()):
+        self.graph = graph
+        self.signale = signale
+        self.anonymesignale = anonymesignale
+        self.grenzen = grenzen
+        self.abgebrochen = 0  # Fahrwege ohne Ziel bei der letzten Suche
+        self.gekuerzt = {}  # Grenze -> verworfene Fahrwege bei der letzten Suche
+        self._eintraege = {}
+        self._abschnitte_cache = {}
+        self._aufloesepunkte_cache = {}
+
+        # (Block, Gleis) der Signale, an denen eine Fahrstraße mit vmax == 0
+        # in der Hauptsignalspalte weitergeht
+        self._zwischenziele = set()
+        for sig in signale.values():
+            for ziel, idx in sig.zeilen.items():
+                spalten = sig.matrix[idx].spalten
+                if spalten and spalten[sig.hsig_spalte].vmax == 0:
+                    self._zwischenziele.add(ziel)
+
+    # Gleiche Einträge werden für alle Fahrstraßen nur einmal angelegt, die
+    # Referenznummer und der Wert des zusätzlichen Attributs nur einmal
+    # formatiert. Die Attribute dürfen daher nicht verändert werden.
+    def _eintrag(self, tag, ref_nr, name=None, wert=None):
+        key = (tag, ref_nr, wert)
+        if (eintrag := self._eintraege.get(key)) is None:
+            if name is None:
+                attrib = {"Ref": str(ref_nr)}
+            else:
+                attrib = {name: str(wert), "Ref": str(ref_nr)}
+            eintrag = self._eintraege[key] = (tag, attrib)
+        return eintrag
+
+    def _kuerzen(self, grenze):
+        self.gekuerzt[grenze] = self.gekuerzt.get(grenze, 0) + 1
+
+    def fahrstrassen(self, startnr, ref_typ, beschreibung):
+        protokoll.info("%s", beschreibung)
+        self.abgebrochen = 0
+        self.gekuerzt = {}
+        g = self.graph
+        max_tiefe, max_fahrstrassen, max_weichen = self.grenzen
+        ergebnis = []
+        pfad = (None, (self._eintrag("FahrstrStart", get_ref_nr(startnr, ref_typ)),))
+
+        # Je Start- bzw. Zwischensignal: (Startelemente, offene Abschnitte,
+        # Pfad bis zum Signal, Tiefe und Weichen bis zum Signal)
+        i = g.index[startnr]
+        stapel = [([startnr], iter(self._abschnitte(i)), pfad, 0, 0)]
+        while stapel:
+            startnrs, abschnitte, pfad, tiefe, weichen = stapel[-1]
+            if (abschnitt := next(abschnitte, None)) is None:
+                stapel.pop()
+                continue
 
-    ET.SubElement(
-        n_strecke,
-        "Datei",
-        {
-            "Dateiname": landschaft.conv_ls(ls_datei, no_displacement=True)[0],
-        },
-    )
+            eintraege, ziel, laenge, anzahl_weichen = abschnitt
+            if ziel == STRECKENENDE or ziel == KREISFAHRT:
+                self.abgebrochen += 1
+                continue
+            if ziel < 0:
+                self._kuerzen(ziel)
+                continue
+            tiefe += laenge
+            weichen += anzahl_weichen
+            if tiefe > max_tiefe:
+                self._kuerzen(GRENZE_TIEFE)
+                continue
+            if weichen > max_weichen:
+                self._kuerzen(GRENZE_WEICHEN)
+                continue
+            if len(ergebnis) >= max_fahrstrassen:
+                self._kuerzen(GRENZE_FAHRSTRASSEN)
+                break
 
-    aufgleispunkte = {}
-    while not (refnr := f.readline()).startswith("#"):
-        elem_nr = int(f.readline())
-        aufgleispunkte[int(refnr)] = elem_nr
-        beschr = f.readline().strip()
-        n_re = allocate_refpunkt(n_strecke, elem_nr, RefTyp.AUFGLEISPUNKT)
-        n_re.attrib["Info"] = beschr
-
-    while not f.readline().startswith("#"):
-        pass
-
-    while True:
-        elem_nr = f.readline()
-
-        if elem_nr == "":
-            break
-        else:
-            elem_nr = int(elem_nr)
-
-        n_str_element = ET.SubElement(n_strecke, "StrElement")
-        nodes[elem_nr] = n_str_element
-        n_str_element.attrib["Nr"] = str(elem_nr)
-        n_str_element.attrib["Anschluss"] = str(0xFF00)
-
-        # "Keine Fahrstraße einrichten" in Gegenrichtung -- sollte nicht notwendig sein,
-        # weil nicht der 3D-Editor die Fahrstraßen erzeugt, sondern dieses Skript.
-        if False:
-            n_gegen = ET.SubElement(n_str_element, "InfoGegenRichtung")
-            ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "21"
-            ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "22"
-            ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "45"
-
-        n_norm = ET.SubElement(n_str_element, "InfoNormRichtung")
-
-        # 32945,2  Kilometrierung in m
-        # +  Zählrichtung der Kilometrierung, zulässige Werte: + (aufsteigend), - (absteigend)
-        # Rehbergtunnel  Landschaftsbezeichnung, # wiederholt die Bezeichnung vom Vorgängerelement
-        # 3007  Ereignis, Codierung s. Ereignisse
-        # 3214,451  x-Anfangs-Standortkoordinate
-        # 318,345  y-Anfangs-Standortkoordinate
-        # 30,853  z-Anfangs-Standortkoordinate
-        # 3193,437  x-End-Standortkoordinate
-        # 312,234  y-End-Standortkoordinate
-        # 31,439  z-End-Standortkoordinate
-        # -0,0231  Überhöhung in rad
-        n_norm.attrib["km"] = str(readfloat(f) / 1000)
-        if f.readline().strip() == "+":
-            n_norm.attrib["pos"] = "1"
-
-        f.readline()
-        er_nr = int(f.readline())
-        conv_ereignis(er_nr, n_norm)
-
-        n_g = ET.SubElement(n_str_element, "g")
-        n_g.attrib["X"] = readfloatstr(f)
-        n_g.attrib["Y"] = readfloatstr(f)
-        n_g.attrib["Z"] = readfloatstr(f)
-
-        n_b = ET.SubElement(n_str_element, "b")
-        n_b.attrib["X"] = readfloatstr(f)
-        n_b.attrib["Y"] = readfloatstr(f)
-        n_b.attrib["Z"] = readfloatstr(f)
-
-        n_str_element.attrib["Ueberh"] = readfloatstr(f)
-
-        succ = [
-            x
-            for x in [int(f.readline()), int(f.readline()), int(f.readline())]
-            if x != 0
-        ]
-        for nr in succ:
-            ET.SubElement(n_str_element, "NachNorm").attrib["Nr"] = str(nr)
-
-        if len(succ) > 1:
-            allocate_refpunkt(n_strecke, elem_nr, RefTyp.WEICHE)
-
-        block = None
-        gleis = None
-
-        n_norm.attrib["vMax"] = str(readfloat(f) / 3.6)
-        for i in range(0, 4):
-            f.readline()
-
-        if (fstrsig_x := readfloatstr(f)) is not None:
-            # Fahrstraßensignal wird in die Gegenrichtung des Elements eingebaut.
-            # So kommen einander Fahrstraßensignal und Kombisignal nicht in die Quere.
-            # Aktiviere "Fahrstraßensignal gilt für beide Fahrtrichtungen" und
-            # die BÜ-Steuerung. Fahrstraßensignale in Zusi 2 haben immer eine eingebaute BÜ-Steuerung.
-            fahrstrsignale.add(elem_nr)
-            n_gegen = ET.SubElement(n_str_element, "InfoGegenRichtung")
-            n_signal = ET.SubElement(n_gegen, "Signal")
-            n_signal.attrib["SignalFlags"] = "9"
-            allocate_refpunkt(n_strecke, elem_nr, RefTyp.SIGNAL_GEGENRICHTUNG)
-            boundingr = 0
-
-            n_p = ET.SubElement(n_signal, "p")
-            n_p.attrib["X"] = fstrsig_x
-            n_p.attrib["Y"] = readfloatstr(f)
-            n_p.attrib["Z"] = readfloatstr(f)
-
-            n_phi = ET.SubElement(n_signal, "phi")
-            n_phi.attrib["X"] = readfloatstr(f)
-            n_phi.attrib["Y"] = str(-readfloat(f))  # TODO warum?
-            n_phi.attrib["Z"] = readfloatstr(f)
-
-            for i in range(6):
-                f.readline()
-
-            sigframe_statisch = f.readline().strip()
-            n_sigframe_statisch = ET.SubElement(n_signal, "SignalFrame")
-            conv = landschaft.conv_ls(sigframe_statisch, no_displacement=True)
-            ET.SubElement(n_sigframe_statisch, "Datei").attrib[
-                "Dateiname"
-            ] = conv.dateiname_zusi
-            boundingr = max(boundingr, conv.boundingr)
-
-            f.readline()  # ohne Funktion
-            if not (sigframe_nicht_gestellt := f.readline()).startswith("#"):
-                n_sigframe_nicht_gestellt = ET.SubElement(n_signal, "SignalFrame")
-                conv = landschaft.conv_ls(
-                    sigframe_nicht_gestellt.strip(), no_displacement=True
+            pfad = self._ziel(startnrs, ziel, (pfad, eintraege), ergebnis)
+            if pfad is not None:
+                startnrs = startnrs + [g.nr[ziel]]
+                stapel.append(
+                    (startnrs, iter(self._abschnitte(ziel)), pfad, tiefe, weichen)
                 )
-                ET.SubElement(n_sigframe_nicht_gestellt, "Datei").attrib[
-                    "Dateiname"
-                ] = conv.dateiname_zusi
-                boundingr = max(boundingr, conv.boundingr)
-                f.readline()  # ohne Funktion
-
-                sigframe_gestellt = f.readline().strip()
-                n_sigframe_gestellt = ET.SubElement(n_signal, "SignalFrame")
-                conv = landschaft.conv_ls(sigframe_gestellt, no_displacement=True)
-                ET.SubElement(n_sigframe_gestellt, "Datei").attrib[
-                    "Dateiname"
-                ] = conv.dateiname_zusi
-                boundingr = max(boundingr, conv.boundingr)
-                f.readline()  # ohne Funktion
 
-                f.readline()  # Signalbilder-Endmarke
+        if self.gekuerzt:
+            protokoll.warnung(
+                "gekürzte Fahrstraßensuchen",
+                "%s: Fahrstraßensuche gekürzt (%s)",
+                beschreibung,
+                ", ".join(
+                    f"{anzahl} × {_GRENZEN[grenze]}"
+                    for grenze, anzahl in self.gekuerzt.items()
+                ),
+            )
+        return ergebnis
+
+    # Einträge vom Zielsignal i bis zu den nächsten Auflösepunkten
+    def _aufloesepunkte(self, i):
+        if (ergebnis := self._aufloesepunkte_cache.get(i)) is None:
+            ergebnis = self._aufloesepunkte_cache[i] = self._aufloesepunkte_suchen(i)
+        eintraege, gekuerzt = ergebnis
+        if gekuerzt:
+            self._kuerzen(GRENZE_TIEFE)
+        return eintraege
+
+    # Liefert (Einträge, gekürzt). Jeder Stapeleintrag (i, start, besucht) ist
+    # ein vollständiger Lauf ab i, bei dem das Element start übergangen wird. An
+    # Verzweigungen laufen die abzweigenden Läufe vor dem Rest des aktuellen
+    # Laufs; sie beginnen wieder beim Ausgangselement des aktuellen Laufs.
+    def _aufloesepunkte_suchen(self, ziel):
+        g = self.graph
+        eintraege = []
+        schritte = 0
+        stapel = [(ziel, ziel, frozenset())]
+        while stapel:
+            i, start, besucht = stapel.pop()
+            # Gleiskreis ohne Hauptsignal: jedes Element nur einmal je Lauf
+            if g.flags[i] & gleisgraph.KREIS:
+                if i in besucht:
+                    continue
+                besucht = besucht | {i}
+            if i != start:
+                if g.flags[i] & gleisgraph.AUFLOESEPUNKT:
+                    eintraege.append(
+                        self._eintrag("FahrstrAufloesung", get_ref_nr(g.nr[i], 5))
+                    )
+                    continue
 
-            fstrsig_er_nr = int(f.readline())  # TODO
+                if g.flags[i] & gleisgraph.SIGNAL:
+                    if self.signale[g.nr[i]].zeile_v0 is not None:
+                        continue
 
-            ET.SubElement(n_signal, "HsigBegriff", {"FahrstrTyp": "1"})
+            a, b = g.succ_start[i], g.succ_start[i + 1]
+            if a == b:
+                continue
+            schritte += 1
+            if schritte > self.grenzen.max_tiefe:
+                return tuple(eintraege), True
+            stapel.append((g.succ[a], start, besucht))
+            for k in range(b - 1, a, -1):
+                stapel.append((start, g.succ[k], frozenset()))
+        return tuple(eintraege), False
+
+    # Alle Abschnitte ab Element start als Liste von (Einträge, Ziel, Tiefe,
+    # Weichen), in der Reihenfolge der Weichenlagen. Ziel ist der Index des
+    # nächsten Signals, STRECKENENDE, KREISFAHRT oder die erreichte Grenze
+    # (GRENZE_...). Ein Fahrweg, der ein Element auf einem Gleiskreis ohne
+    # Hauptsignal (gleisgraph.KREIS) oder das Startelement ein zweites Mal
+    # erreicht, endet mit KREISFAHRT.
+    # Die Einträge enthalten Register, Teilauflösungen, Fahrstraßensignale und
+    # Weichen bis einschließlich des Zielelements.
+    # Gespeichert werden nur die Abschnitte ab möglichen Zwischenzielen, die ab
+    # einem reinen Startsignal werden nur einmal gebraucht.
+    def _abschnitte(self, start):
+        if (abschnitte := self._abschnitte_cache.get(start)) is None:
+            abschnitte = self._abschnitte_suchen(start)
+            sig = self.signale.get(self.graph.nr[start])
+            if sig is not None and (sig.block, sig.gleis) in self._zwischenziele:
+                self._abschnitte_cache[start] = abschnitte
+        return abschnitte
+
+    def _abschnitte_suchen(self, start):
+        g = self.graph
+        max_tiefe, max_abschnitte, max_weichen = self.grenzen
+        abschnitte = []
+        # (Element, Einträge bis dahin, Tiefe, Weichen, besuchte Kreiselemente)
+        stapel = [(start, [], 0, 0, frozenset())]
+        while stapel:
+            if len(abschnitte) >= max_abschnitte:
+                abschnitte.append(((), GRENZE_FAHRSTRASSEN, 0, 0))
+                break
+            i, eintraege, tiefe, weichen, besucht = stapel.pop()
+            while True:
+                elnr = g.nr[i]
+                flags = g.flags[i]
+                if flags & gleisgraph.KREIS or i == start:
+                    if i in besucht:
+                        abschnitte.append(((), KREISFAHRT, tiefe, weichen))
+                        break
+                    besucht = besucht | {i}
+                if i != start:
+                    if flags & gleisgraph.REGISTER:
+                        eintraege.append(
+                            self._eintrag("FahrstrRegister", get_ref_nr(elnr, 2))
+                        )
 
-            ET.SubElement(
-                n_signal,
-                "HsigBegriff",
-                {
-                    "HsigGeschw": "-1",
-                    "FahrstrTyp": "1",  # Fahrweg
-                },
-            )
-            ET.SubElement(n_signal, "VsigBegriff", {"VsigGeschw": "-1"})
-
-            me = ET.SubElement(
-                n_signal,
-                "MatrixEintrag",
-                {
-                    "MatrixGeschw": "-1",
-                    "Signalbild": "3",
-                },
-            )
-            conv_ereignis(fstrsig_er_nr, me)
-
-            me = ET.SubElement(
-                n_signal,
-                "MatrixEintrag",
-                {
-                    "MatrixGeschw": "-1",
-                    "Signalbild": "5",
-                },
-            )
-            conv_ereignis(fstrsig_er_nr, me)
+                    if flags & gleisgraph.AUFLOESEPUNKT:
+                        eintraege.append(
+                            self._eintrag("FahrstrTeilaufloesung", get_ref_nr(elnr, 5))
+                        )
 
-            n_signal.attrib["BoundingR"] = str(int(math.ceil(boundingr)))
+                    if flags & gleisgraph.FAHRSTRSIGNAL:
+                        eintraege.append(
+                            self._eintrag(
+                                "FahrstrSignal",
+                                get_ref_nr(elnr, RefTyp.SIGNAL_GEGENRICHTUNG),
+                                "FahrstrSignalZeile",
+                                1,
+                            )
+                        )
 
-            f.readline()  # Am Signal angekündigte Geschwindigkeit
-            if (fstrsig_koppelsignal_element := int(f.readline())) != 0:
-                ET.SubElement(
-                    ET.SubElement(
-                        n_signal,
-                        "KoppelSignal",
-                        {
-                            "ReferenzNr": str(
-                                get_ref_nr(
-                                    fstrsig_koppelsignal_element,
-                                    RefTyp.SIGNAL_GEGENRICHTUNG,
-                                )
+                    if flags & gleisgraph.SIGNAL:
+                        abschnitte.append((tuple(eintraege), i, tiefe, weichen))
+                        break
+
+                a, b = g.succ_start[i], g.succ_start[i + 1]
+                if a == b:
+                    abschnitte.append((tuple(eintraege), STRECKENENDE, tiefe, weichen))
+                    break
+                tiefe += 1
+                if tiefe > max_tiefe:
+                    abschnitte.append(((), GRENZE_TIEFE, tiefe, weichen))
+                    break
+                if b - a > 1:
+                    weichen += 1
+                    if weichen > max_weichen:
+                        abschnitte.append(((), GRENZE_WEICHEN, tiefe, weichen))
+                        break
+
+                # Weichenlagen in umgekehrter Reihenfolge auf den Stapel, damit
+                # die erste zuerst weiter verfolgt wird
+                for idx in range(b - a - 1, -1, -1):
+                    succ = g.succ[a + idx]
+                    eintraege2 = eintraege if idx == 0 else eintraege.copy()
+
+                    pa, pb = g.pred_start[succ], g.pred_start[succ + 1]
+                    if pb - pa > 1:
+                        eintraege2.append(
+                            self._eintrag(
+                                "FahrstrWeiche",
+                                get_ref_nr(g.nr[succ], RefTyp.WEICHE_GEGENRICHTUNG),
+                                "FahrstrWeichenlage",
+                                g.pred[pa:pb].index(i) + 1,
                             )
-                        },
-                    ),
-                    "Datei",
-                    {"Dateiname": outname_rel, "NurInfo": "1"},
-                )
+                        )
 
-        if (x1 := readfloat(f)) is not None:
-            # Kombisignal
-            sig = Signal()
-            n_signal = ET.SubElement(n_norm, "Signal")
-            boundingr = 0
-
-            y1 = readfloat(f)
-            z1 = readfloat(f)
-            rx1 = readfloatstr(f)
-            ry1 = readfloatstr(f)
-            rz1 = readfloatstr(f)
-
-            x2 = readfloat(f)
-            y2 = readfloat(f)
-            z2 = readfloat(f)
-            rx2 = readfloatstr(f)
-            ry2 = readfloatstr(f)
-            rz2 = readfloatstr(f)
-
-            if not x1 and not y1 and not z1:
-                xorigin, yorigin, zorigin = x2, y2, z2
-            elif not x2 and not y2 and not z2:
-                xorigin, yorigin, zorigin = x1, y1, z1
-            else:
-                xorigin, yorigin, zorigin = (
-                    (x1 + x2) / 2.0,
-                    (y1 + y2) / 2.0,
-                    (z1 + z2) / 2.0,
-                )
+                    if b - a > 1:
+                        eintraege2.append(
+                            self._eintrag(
+                                "FahrstrWeiche",
+                                get_ref_nr(elnr, 3),
+                                "FahrstrWeichenlage",
+                                idx + 1,
+                            )
+                        )
+                        stapel.append((succ, eintraege2, tiefe, weichen, besucht))
+                    else:
+                        i = succ
+                if b - a > 1:
+                    break
+        return abschnitte
+
+    # Verknüpft das Zielsignal i. Liefert den Pfad, mit dem die Suche hinter
+    # dem Zielsignal weitergeht (vmax == 0), sonst None.
+    def _ziel(self, startnrs, i, pfad, ergebnis):
+        signale = self.signale
+        elnr = self.graph.nr[i]
+        sig = signale[elnr]
+        # TODO Ziel nur bei Signalen mit Zeile v=0?
+        #   (if any(mz.vmax == 0 for mz in sig.matrix), gibt es diese
+        #   Unterscheidung auch in Zusi 2?)
+        startsig = signale.get(startnrs[-1])  # None: Aufgleispunkt
+
+        # Zielsignal verknüpfen
+        zeile_v0 = sig.zeile_v0
+        if zeile_v0 is None:
+            protokoll.warnung(
+                "Signale ohne Zeile v=0",
+                "Signal ohne Zeile v=0",
+            )
+            zeile_v0 = 0
 
-            ET.SubElement(
-                n_signal,
-                "p",
-                {
-                    "X": str(xorigin),
-                    "Y": str(yorigin),
-                    "Z": str(zorigin),
-                },
+        eintraege = [
+            self._eintrag(
+                "FahrstrSignal", get_ref_nr(elnr, 4), "FahrstrSignalZeile", zeile_v0
             )
+        ]
 
-            # Erste .ls-Datei
-            sigframes = []
-            while not (lsdatei := f.readline().strip()).startswith("#"):
-                sig.anzahl_sigframes += 1
-                n_signalframe = ET.Element("SignalFrame")
-                sigframes.append(n_signalframe)
-                conv = landschaft.conv_ls(lsdatei, no_displacement=True)
-                ET.SubElement(
-                    n_signalframe, "Datei", {"Dateiname": conv.dateiname_zusi}
+        # Startsignal und Vorsignale verknüpfen
+        if startsig is not None:
+            idx = startsig.zeilen.get((sig.block, sig.gleis))
+            if idx is None:
+                protokoll.warnung(
+                    "Fahrwege ohne Matrixzeile",
+                    "%s: keine zeile für Fahrweg nach %s (%s %s) gefunden",
+                    startnrs[-1],
+                    elnr,
+                    sig.block,
+                    sig.gleis,
                 )
-                boundingr = max(boundingr, conv.boundingr)
-                # Position
-                if f.readline().startswith("2"):
-                    ET.SubElement(
-                        n_signalframe,
-                        "p",
-                        {
-                            "X": str(x2 - xorigin),
-                            "Y": str(y2 - yorigin),
-                            "Z": str(z2 - zorigin),
-                        },
-                    )
-                    ET.SubElement(
-                        n_signalframe,
-                        "phi",
-                        {
-                            "X": str(rx2),
-                            "Y": str(ry2),
-                            "Z": str(rz2),
-                        },
-                    )
-                else:
-                    ET.SubElement(
-                        n_signalframe,
-                        "p",
-                        {
-                            "X": str(x1 - xorigin),
-                            "Y": str(y1 - yorigin),
-                            "Z": str(z1 - zorigin),
-                        },
-                    )
-                    ET.SubElement(
-                        n_signalframe,
-                        "phi",
-                        {
-                            "X": str(rx1),
-                            "Y": str(ry1),
-                            "Z": str(rz1),
-                        },
-                    )
+                self.abgebrochen += 1
+                return None
+
+            eintraege.append(
+                self._eintrag(
+                    "FahrstrSignal",
+                    get_ref_nr(startnrs[-1], 4),
+                    "FahrstrSignalZeile",
+                    idx,
+                )
+            )
 
-            sig.elnr = elem_nr
-            sig.block = f.readline().strip()
-            sig.gleis = f.readline().strip()
-
-            numzeilen = int(f.readline()) + 1
-            numspalten = int(f.readline()) + 1
-
-            sig.matrix = []
-
-            seen_blocks = set()
-            for i in range(0, numzeilen):
-                # Fahrziel-Block, Fahrziel-Gleis, vmax, #, #
-                mz = MatrixZeile()
-                mz.block = f.readline().strip()
-                mz.gleis = f.readline().strip()
-                if mz.block or mz.gleis:
-                    assert f"{mz.block} {mz.gleis}" not in seen_blocks
-                    seen_blocks.add(f"{mz.block} {mz.gleis}")
-                mz.vmax = int(f.readline())
-                sig.matrix.append(mz)
-                f.readline()
-                f.readline()
-
-                if True:  # mz.vmax == 0 or mz.block or mz.gleis:
-                    n_hsig_begriff = ET.SubElement(
-                        n_signal,
-                        "HsigBegriff",
-                        {
-                            "FahrstrTyp": "6",
-                            "HsigGeschw": "0" if mz.vmax == 0 else str(mz.vmax / 3.6),
-                        },
+            # signalisierte Geschwindigkeit
+            me = startsig.matrix[idx].spalten[startsig.hsig_spalte]
+            hsig_geschw = me.vmax
+            ID = me.id
+
+            for vsig_nr in startsig.vsigs:
+                try:
+                    vsig = signale[vsig_nr]
+                except KeyError:
+                    try:
+                        vsig = self.anonymesignale[vsig_nr]
+                    except KeyError:
+                        protokoll.warnung(
+                            "fehlende Vorsignale",
+                            "Kein Vorsignal an Element %s",
+                            vsig_nr,
+                        )
+                        continue
+
+                eintraege.append(
+                    self._eintrag(
+                        "FahrstrVSignal",
+                        get_ref_nr(vsig_nr, 4),
+                        "FahrstrSignalSpalte",
+                        get_vsig_spalte(vsig, hsig_geschw, ID),
                     )
+                )
+            if hsig_geschw == 0:
+                protokoll.debug(
+                    " -> %s %s: vmax == 0 -> weiter",
+                    sig.block,
+                    sig.gleis,
+                )
+                return (pfad, tuple(eintraege))
 
-            # if any(mz.vmax == 0 for mz in sig.matrix):
-            #    ET.SubElement(n_norm, "Ereignis", {"Er":"29", "Beschr": f"{sig.block} {sig.gleis}"})
+        eintraege.append(self._eintrag("FahrstrZiel", get_ref_nr(elnr, 4)))
+        fname = ""
+        for startnr in startnrs:
+            try:
+                startsig = signale[startnr]
+                fname += f"{startsig.block} {startsig.gleis} -> "
+            except KeyError:
+                fname += f"Aufgleispunkt -> "
+        fname += f"{sig.block} {sig.gleis}"
 
-            for i in range(0, numspalten):
-                vsig_geschw = int(f.readline())
-                sig.vsig_geschw.append(vsig_geschw)
-                n_vsig_begriff = ET.SubElement(
-                    n_signal,
-                    "VsigBegriff",
-                    {
-                        "VsigGeschw": "-1"
-                        if vsig_geschw == -1
-                        else str(vsig_geschw / 3.6),
-                    },
-                )
+        pfad = ((pfad, tuple(eintraege)), self._aufloesepunkte(i))
 
-            # Aus bei Hp0
-            f.readline()
-
-            for i in range(0, numzeilen):
-                mz = sig.matrix[i]
-                for j in range(0, numspalten):
-                    me = MatrixEintrag()
-                    me.bild = int(f.readline())
-                    me.vmax = int(f.readline())
-                    if me.vmax == 0 and sig.matrix[i].vmax != 0:
-                        print(
-                            f"Element {elem_nr}, Zeile {i}, Spalte {j}: v=0, aber Zeile v!=0",
-                            file=sys.stderr,
-                        )
-                    me.id = int(f.readline())
-                    me.er1 = int(f.readline())
-                    me.er2 = int(f.readline())
-                    f.readline()
+        ergebnis.append(Fahrstrasse(fname, pfad_eintraege(pfad)))
+        protokoll.debug(" -> %s", fname)
+        return None
 
-                    sig.matrix[i].spalten.append(me)
 
-                    if True:  # mz.vmax == 0 or mz.block or mz.gleis:
-                        n_me = ET.SubElement(
-                            n_signal,
-                            "MatrixEintrag",
-                            {
-                                "MatrixGeschw": "-1"
-                                if me.vmax == -1
-                                else str(me.vmax / 3.6),
-                                "Signalbild": str(me.bild),
-                            },
-                        )
+# Fahrstraßensuche in Worker-Prozessen. Der Gleisgraph wird beim Start jedes
+# Workers einmal übertragen und ist danach nur noch lesend im Zugriff. Die in
+# einem Worker gezählten Warnungen werden mit jedem Ergebnis zurückgegeben.
+_worker_suche = None
 
-            ersatz_bild = int(f.readline())
-            ersatz_vmax = int(f.readline())
-            ersatz_id = int(f.readline())
-            ersatz_er1 = int(f.readline())
-            ersatz_er2 = int(f.readline())
-            ersatz_reserviert = f.readline()
-            f.readline()  # Wahrsch. Ersatzsignal
-
-            vsig = f.readline()
-            while not vsig.startswith("#"):
-                sig.vsigs.append(int(vsig))
-                vsig = f.readline()
-
-            f.readline()  # reserviert
-
-            if sig.block != "" and sig.gleis != "":
-                n_signal.attrib["NameBetriebsstelle"] = sig.block
-                n_signal.attrib["Stellwerk"] = sig.block
-                n_signal.attrib["Signalname"] = sig.gleis
-                signale[elem_nr] = sig
-            else:
-                n_signal.attrib["Signalname"] = f"Element {elem_nr}"
-                anonymesignale[elem_nr] = sig
 
-            for sigframe in sigframes:
-                n_signal.append(sigframe)
+def _init_fahrstrassen_worker(suche, stufe):
+    global _worker_suche
+    _worker_suche = suche
+    protokoll.worker_init(stufe)
 
-            n_signal.attrib["BoundingR"] = str(int(math.ceil(boundingr)))
 
-            allocate_refpunkt(n_strecke, elem_nr, RefTyp.SIGNAL)
+def _fahrstrassen_worker(start):
+    return _fahrstrassen_gemessen(_worker_suche, start) + (protokoll.abholen(),)
 
-        register = int(f.readline())
 
-        if er_nr == 3002:
-            allocate_refpunkt(n_strecke, elem_nr, RefTyp.AUFLOESEPUNKT)
+def _fahrstrassen_gemessen(suche, start):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    fahrstrassen = suche.fahrstrassen(*start)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    gekuerzt = sum(suche.gekuerzt.values())
+    return fahrstrassen, (wall, cpu, suche.abgebrochen, gekuerzt)
+
+
+def _messung_melden(suche, start, fahrstrassen, messung):
+    wall, cpu, abgebrochen, gekuerzt = messung
+    sig = suche.signale.get(start[0])
+    profil.fahrstrassen_start(
+        start[0],
+        start[2],
+        sig.block if sig is not None else None,
+        wall,
+        cpu,
+        len(fahrstrassen),
+        abgebrochen,
+        gekuerzt,
+    )
 
-            if register == 0:
-                print(
-                    f"kein Register an Auflöseelement {elem_nr}, erfinde eins",
-                    file=sys.stderr,
-                )
-                register = regnr
-                regnr += 1
-
-        if block is not None and gleis is not None:
-            elements[elem_nr]["block"] = block
-            elements[elem_nr]["gleis"] = gleis
-
-        if register != 0:
-            n_norm.attrib["Reg"] = str(register)
-            allocate_refpunkt(n_strecke, elem_nr, RefTyp.REGISTER)
-
-        elements[elem_nr] = {
-            "succ": succ,
-            "register": register,
-            "aufloesepunkt": er_nr == 3002,
-        }
-
-    for elem_nr, element in elements.items():
-        for succ in element["succ"]:
-            ET.SubElement(nodes[succ], "NachGegen").attrib["Nr"] = str(elem_nr)
-            try:
-                preds = elements[succ]["pred"]
-            except KeyError:
-                elements[succ]["pred"] = [elem_nr]
-                continue
 
-            if len(preds) == 1:
-                allocate_refpunkt(n_strecke, succ, RefTyp.WEICHE_GEGENRICHTUNG)
-            preds.append(elem_nr)
-
-    # Fahrstraßen
-
-    def v_kleiner(v1, v2):
-        if v2 == -1:
-            return True
-        elif v1 == -1:
-            return False
-        else:
-            return v1 < v2
-
-    def get_vsig_spalte(sig, v, ID):
-        id_counter = 0
-        for idx, vsig_geschw in enumerate(sig.vsig_geschw):
-            if v == vsig_geschw:
-                if id_counter == ID:
-                    return idx
+def _fahrstrassen_seriell(suche, starts):
+    for start in starts:
+        with profil.phase("fahrstrassensuche"):
+            fahrstrassen, messung = _fahrstrassen_gemessen(suche, start)
+        _messung_melden(suche, start, fahrstrassen, messung)
+        yield from fahrstrassen
+
+
+def _fahrstrassen_einsammeln(suche, starts, ergebnisse):
+    for start in starts:
+        # Im Hauptprozess zählt als Suche die Zeit, in der auf die Worker
+        # gewartet wird.
+        with profil.phase("fahrstrassensuche"):
+            fahrstrassen, messung, warnungen = next(ergebnisse)
+        protokoll.melden(warnungen)
+        _messung_melden(suche, start, fahrstrassen, messung)
+        yield from fahrstrassen
+
+
+# Liefert einen Iterator über die Fahrstraßen in der Reihenfolge der
+# Startsignale. Mit worker > 0 beginnt die Suche in so vielen Worker-Prozessen
+# schon beim Betreten des with-Blocks, der Hauptprozess kann in der Zwischenzeit
+# anderes erledigen (z.B. die Signalframes konvertieren). Mit worker = 0 sucht
+# der Hauptprozess beim Durchlaufen des Iterators.
+@contextlib.contextmanager
+def fahrstrassen_parallel(suche, starts, worker):
+    if worker <= 0 or len(starts) <= 1:
+        yield _fahrstrassen_seriell(suche, starts)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker,
+        initializer=_init_fahrstrassen_worker,
+        initargs=(suche, protokoll.stufe()),
+    ) as executor:
+        chunksize = max(1, len(starts) // (4 * worker))
+        # map() reicht alle Startsignale sofort ein.
+        ergebnisse = executor.map(_fahrstrassen_worker, starts, chunksize=chunksize)
+        try:
+            yield _fahrstrassen_einsammeln(suche, starts, ergebnisse)
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+# Schreibt die .st3-Datei, ohne den ganzen XML-Baum im Speicher zu halten.
+#
+# Während des Einlesens nimmt n_strecke nur die Kindknoten des gerade gelesenen
+# Streckenelements auf. flush() schreibt sie in eine temporäre Datei, die
+# StrElement-Knoten noch ohne schließendes Tag, weil die NachGegen-Verweise erst
+# feststehen, wenn alle Elemente gelesen sind. StrElemente mit Signalen bleiben
+# bis zum Schreiben im Speicher, weil ihr BoundingR erst nach der Konvertierung
+# der Signalframes bekannt ist.
+#
+# write() kopiert die temporäre Datei in die Ausgabedatei, ergänzt dabei die
+# NachGegen-Verweise und hängt danach die Fahrstraßen einzeln an.
+class St3Writer:
+    def __init__(self):
+        self.n_strecke = ET.Element("Strecke")
+        self.spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        # (Elementnummer oder None, Textlänge in der temporären Datei oder Knoten)
+        self.index = []
+
+    def flush(self, verzoegert=False):
+        for node in self.n_strecke:
+            if node.tag == "StrElement":
+                if verzoegert:
+                    self.index.append((int(node.attrib["Nr"]), node))
+                    continue
+                text = ET.tostring(node, encoding="unicode")[: -len("</StrElement>")]
+                self.spool.write(text)
+                self.index.append((int(node.attrib["Nr"]), len(text)))
+            else:
+                text = ET.tostring(node, encoding="unicode")
+                self.spool.write(text)
+                if self.index and self.index[-1][0] is None:
+                    self.index[-1] = (None, self.index[-1][1] + len(text))
                 else:
-                    id_counter += 1
+                    self.index.append((None, len(text)))
+        del self.n_strecke[:]
+
+    def write(self, outname_abs, graph, fahrstrassen):
+        self.flush()
+        self.spool.seek(0)
+        with open(
+            outname_abs, "w", encoding="utf-8", errors="xmlcharrefreplace"
+        ) as fout:
+            fout.write("<Zusi><Strecke>")
+            for elem_nr, inhalt in self.index:
+                if isinstance(inhalt, int):
+                    fout.write(self.spool.read(inhalt))
+                else:
+                    fout.write(
+                        ET.tostring(inhalt, encoding="unicode")[: -len("</StrElement>")]
+                    )
+                if elem_nr is not None:
+                    for pred in graph.preds(graph.index[elem_nr]):
+                        fout.write(f'<NachGegen Nr="{graph.nr[pred]}" />')
+                    fout.write("</StrElement>")
+            for text in fahrstrassen:
+                fout.write(text)
+            fout.write("</Strecke></Zusi>")
+        self.spool.close()
+
+
+def conv_str(strname, jobs=1, grenzen=Suchgrenzen()):
+    manifest_key = os.path.abspath(strname)
+    with manifest.aufzeichnung() as aufzeichnung:
+        # Die Suchgrenzen gehören zum Ergebnis, nicht zum Schlüssel: Es gibt nur
+        # eine .st3-Datei, die mit anderen Grenzen neu geschrieben werden muss.
+        ergebnis = manifest.lookup("str", manifest_key)
+        if ergebnis is not None and ergebnis[2] == list(grenzen):
+            protokoll.info("%s unverändert, wird nicht konvertiert", strname)
+            return tuple(ergebnis[:2])
+        ergebnis = _conv_str(strname, jobs, grenzen)
+        manifest.store("str", manifest_key, aufzeichnung, [*ergebnis, list(grenzen)])
+    return ergebnis
+
+
+# Liest den Dateikopf bis zur Rekursionstiefe und liefert, was conv_str()
+# zurückgibt: (Name der .st3-Datei, Rekursionstiefe).
+def _kopf_lesen(f):
+    outname_rel = _st3_name(f.name)
+
+    zusiversion = f.next_str()
+    if zusiversion != "2.3":
+        raise f.fehler(f"Version {zusiversion} wird nicht gelesen")
+
+    f.skip(2)
+
+    return outname_rel, f.next_int()
+
+
+def _st3_name(strname):
+    inname_rel = os.path.relpath(strname[:-1] + "3", common.Z2ABS).replace(os.sep, "\\")
+    return common.z2rel_to_z3rel(inname_rel)
+
+
+# Liefert das Ergebnis von conv_str(), ohne die Strecke zu konvertieren, damit
+# die Fahrpläne schon während der Konvertierung der Strecke beginnen können.
+def kopf(strname):
+    if (s := schnappschuss(strname)) is not None:
+        return s.st3_name, s.rekursionstiefe
+    with common.Reader(strname) as f:
+        return _kopf_lesen(f)
+
+
+# Liefert die ls-Dateien (Landschaft und Signalframes), die conv_str() konvertiert,
+# ohne die Strecke zu parsen: In der .str-Datei sind das die Zeilen mit Endung .ls.
+def ls_dateien(strname):
+    dateien = []
+    with open(strname, "rb") as f:
+        for zeile in f:
+            zeile = zeile.strip()
+            if zeile.lower().endswith(b".ls"):
+                dateien.append(zeile.decode("iso-8859-1"))
+    return list(dict.fromkeys(dateien))
+
+
+# Was Fahrpläne über eine bereits konvertierte Strecke wissen müssen, ohne die
+# .str erneut zu lesen. conv_str() speichert es neben der .st3-Datei, gültig
+# für den SHA-1 der .str-Datei.
+#  aufgleispunkte: {Referenznummer: Elementnummer}
+#  gleise: {(Betriebsstelle, Gleis)} der Hauptsignale
+#  fahrstrassen: {Name} der erzeugten Fahrstraßen
+#  grenzen: die Suchgrenzen, mit denen die Fahrstraßen gesucht wurden
+Schnappschuss = namedtuple(
+    "Schnappschuss",
+    [
+        "st3_name",
+        "rekursionstiefe",
+        "aufgleispunkte",
+        "gleise",
+        "fahrstrassen",
+        "grenzen",
+    ],
+)
+SCHNAPPSCHUSS_ENDUNG = ".pickle"
+SCHNAPPSCHUSS_VERSION = 2
+
+
+def _schnappschuss_speichern(strname, schnappschuss):
+    pfad = common.z3rel_to_abs(schnappschuss.st3_name) + SCHNAPPSCHUSS_ENDUNG
+    daten = {
+        "version": SCHNAPPSCHUSS_VERSION,
+        "sha1": manifest.sha1(os.path.abspath(strname)),
+        **schnappschuss._asdict(),
+    }
+    with open(pfad + ".tmp", "wb") as f:
+        pickle.dump(daten, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(pfad + ".tmp", pfad)
+    manifest.ausgabe(pfad)
+
+
+# Liefert den Schnappschuss der Strecke oder None, wenn es keinen gibt, sich die
+# .str-Datei seitdem geändert hat oder er mit anderen Suchgrenzen entstand.
+# grenzen=None: beliebige Suchgrenzen, z.B. für st3_name und rekursionstiefe.
+def schnappschuss(strname, grenzen=None):
+    pfad = common.z3rel_to_abs(_st3_name(strname)) + SCHNAPPSCHUSS_ENDUNG
+    try:
+        with open(pfad, "rb") as f:
+            daten = pickle.load(f)
+        if daten.pop("version") != SCHNAPPSCHUSS_VERSION:
+            return None
+        if daten.pop("sha1") != manifest.sha1(os.path.abspath(strname)):
+            return None
+    except (
+        OSError,
+        pickle.UnpicklingError,
+        EOFError,
+        ValueError,  # z.B. unbekanntes Pickle-Protokoll
+        KeyError,
+        TypeError,
+    ):
+        return None
+    # Passen die Felder nicht zur Version, ist das ein Fehler im Programm.
+    if grenzen is not None and daten["grenzen"] != tuple(grenzen):
+        return None
+    return Schnappschuss(**daten)
+
+
+def _conv_str(strname, jobs, grenzen):
+    graph = gleisgraph.Gleisgraph()
+    signale = {}
+    anonymesignale = {}
+    regnr = 20000  # TODO
 
-        spalte = 0
-        spalte_geschw = -1
-        for idx, vsig_geschw in enumerate(sig.vsig_geschw):
-            if v != 0 and vsig_geschw != 0:
-                if v_kleiner(vsig_geschw, v):
-                    if vsig_geschw > spalte_geschw:
-                        spalte = idx
-                        spalte_geschw = vsig_geschw
+    writer = St3Writer()
+    n_strecke = writer.n_strecke
 
-        return spalte
+    with profil.phase("kopf"):
+        f = common.Reader(strname)
+        manifest.quelle(os.path.abspath(strname))
+        outname_rel, rekursionstiefe = _kopf_lesen(f)
 
-    def get_aufloesepunkte_rek(elnr, startnr, n_fahrstrasse):
-        while True:
-            element = elements[elnr]
-            if elnr != startnr:
-                if element["aufloesepunkt"]:
-                    ET.SubElement(
-                        ET.SubElement(
-                            n_fahrstrasse,
-                            "FahrstrAufloesung",
-                            {"Ref": str(get_ref_nr(elnr, 5))},
-                        ),
-                        "Datei",
-                        {"Dateiname": outname_rel, "NurInfo": "1"},
+        for i in range(0, 2):
+            f.next_until("#")
+
+        f.skip()
+        ls_datei = f.next_str()
+
+        # Die ls-Dateien (Landschaft und Signale) werden erst nach dem Einlesen
+        # der Strecke gemeinsam konvertiert, siehe landschaft.conv_ls_parallel().
+        ls_dateien = [ls_datei]
+        signal_sigframes = []  # (Signal-Knoten, ls-Dateien der Signalframes)
+
+        ET.SubElement(
+            n_strecke,
+            "Datei",
+            {
+                "Dateiname": landschaft.ls3_name(ls_datei, no_displacement=True),
+            },
+        )
+
+        aufgleispunkte = {}
+        while not (refnr := f.next_line()).startswith("#"):
+            elem_nr = f.next_int()
+            aufgleispunkte[int(refnr)] = elem_nr
+            beschr = f.next_str()
+            n_re = allocate_refpunkt(n_strecke, elem_nr, RefTyp.AUFGLEISPUNKT)
+            n_re.attrib["Info"] = beschr
+
+        f.next_until("#")
+
+        writer.flush()
+
+    with profil.phase("elemente"):
+        while not f.eof():
+            elem_nr = f.next_int()
+
+            anzahl_signale = len(signal_sigframes)
+            n_str_element = ET.SubElement(n_strecke, "StrElement")
+            n_str_element.attrib["Nr"] = str(elem_nr)
+            n_str_element.attrib["Anschluss"] = str(0xFF00)
+
+            # "Keine Fahrstraße einrichten" in Gegenrichtung -- sollte nicht notwendig sein,
+            # weil nicht der 3D-Editor die Fahrstraßen erzeugt, sondern dieses Skript.
+            if False:
+                n_gegen = ET.SubElement(n_str_element, "InfoGegenRichtung")
+                ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "21"
+                ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "22"
+                ET.SubElement(n_gegen, "Ereignis").attrib["Er"] = "45"
+
+            n_norm = ET.SubElement(n_str_element, "InfoNormRichtung")
+
+            # 32945,2  Kilometrierung in m
+            # +  Zählrichtung der Kilometrierung, zulässige Werte: + (aufsteigend), - (absteigend)
+            # Rehbergtunnel  Landschaftsbezeichnung, # wiederholt die Bezeichnung vom Vorgängerelement
+            # 3007  Ereignis, Codierung s. Ereignisse
+            # 3214,451  x-Anfangs-Standortkoordinate
+            # 318,345  y-Anfangs-Standortkoordinate
+            # 30,853  z-Anfangs-Standortkoordinate
+            # 3193,437  x-End-Standortkoordinate
+            # 312,234  y-End-Standortkoordinate
+            # 31,439  z-End-Standortkoordinate
+            # -0,0231  Überhöhung in rad
+            n_norm.attrib["km"] = str(f.next_float() / 1000)
+            if f.next_str() == "+":
+                n_norm.attrib["pos"] = "1"
+
+            f.skip()
+            er_nr = f.next_int()
+            conv_ereignis(er_nr, n_norm)
+
+            n_g = ET.SubElement(n_str_element, "g")
+            n_g.attrib["X"] = f.next_floatstr()
+            n_g.attrib["Y"] = f.next_floatstr()
+            n_g.attrib["Z"] = f.next_floatstr()
+
+            n_b = ET.SubElement(n_str_element, "b")
+            n_b.attrib["X"] = f.next_floatstr()
+            n_b.attrib["Y"] = f.next_floatstr()
+            n_b.attrib["Z"] = f.next_floatstr()
+
+            n_str_element.attrib["Ueberh"] = f.next_floatstr()
+
+            succ = [
+                x
+                for x in [f.next_int(), f.next_int(), f.next_int()]
+                if x != 0
+            ]
+            for nr in succ:
+                ET.SubElement(n_str_element, "NachNorm").attrib["Nr"] = str(nr)
+
+            if len(succ) > 1:
+                allocate_refpunkt(n_strecke, elem_nr, RefTyp.WEICHE)
+
+            flags = 0
+
+            n_norm.attrib["vMax"] = str(f.next_float() / 3.6)
+            for i in range(0, 4):
+                f.skip()
+
+            if (fstrsig_x := f.next_floatstr()) is not None:
+                # Fahrstraßensignal wird in die Gegenrichtung des Elements eingebaut.
+                # So kommen einander Fahrstraßensignal und Kombisignal nicht in die Quere.
+                # Aktiviere "Fahrstraßensignal gilt für beide Fahrtrichtungen" und
+                # die BÜ-Steuerung. Fahrstraßensignale in Zusi 2 haben immer eine eingebaute BÜ-Steuerung.
+                flags |= gleisgraph.FAHRSTRSIGNAL
+                n_gegen = ET.SubElement(n_str_element, "InfoGegenRichtung")
+                n_signal = ET.SubElement(n_gegen, "Signal")
+                n_signal.attrib["SignalFlags"] = "9"
+                allocate_refpunkt(n_strecke, elem_nr, RefTyp.SIGNAL_GEGENRICHTUNG)
+                sigframe_dateien = []
+
+                n_p = ET.SubElement(n_signal, "p")
+                n_p.attrib["X"] = fstrsig_x
+                n_p.attrib["Y"] = f.next_floatstr()
+                n_p.attrib["Z"] = f.next_floatstr()
+
+                n_phi = ET.SubElement(n_signal, "phi")
+                n_phi.attrib["X"] = f.next_floatstr()
+                n_phi.attrib["Y"] = str(-f.next_float())  # TODO warum?
+                n_phi.attrib["Z"] = f.next_floatstr()
+
+                for i in range(6):
+                    f.skip()
+
+                sigframe_statisch = f.next_str()
+                n_sigframe_statisch = ET.SubElement(n_signal, "SignalFrame")
+                sigframe_dateien.append(sigframe_statisch)
+                ET.SubElement(n_sigframe_statisch, "Datei").attrib[
+                    "Dateiname"
+                ] = landschaft.ls3_name(sigframe_statisch, no_displacement=True)
+
+                f.skip()  # ohne Funktion
+                if not (sigframe_nicht_gestellt := f.next_line()).startswith("#"):
+                    n_sigframe_nicht_gestellt = ET.SubElement(n_signal, "SignalFrame")
+                    sigframe_dateien.append(sigframe_nicht_gestellt.strip())
+                    ET.SubElement(n_sigframe_nicht_gestellt, "Datei").attrib[
+                        "Dateiname"
+                    ] = landschaft.ls3_name(
+                        sigframe_nicht_gestellt.strip(), no_displacement=True
                     )
-                    break
+                    f.skip()  # ohne Funktion
 
-                if elnr in signale:
-                    sig = signale[elnr]
-                    if any(mz.vmax == 0 for mz in sig.matrix):
-                        break
+                    sigframe_gestellt = f.next_str()
+                    n_sigframe_gestellt = ET.SubElement(n_signal, "SignalFrame")
+                    sigframe_dateien.append(sigframe_gestellt)
+                    ET.SubElement(n_sigframe_gestellt, "Datei").attrib[
+                        "Dateiname"
+                    ] = landschaft.ls3_name(sigframe_gestellt, no_displacement=True)
+                    f.skip()  # ohne Funktion
 
-            succs = element["succ"]
-            if not succs:
-                break
-            for idx in range(1, len(succs)):
-                get_aufloesepunkte_rek(startnr, succs[idx], n_fahrstrasse)
-            elnr = succs[0]
-
-    def get_fahrstr_rek(startnrs, elnr, n_fahrstrasse):
-        while True:
-            element = elements[elnr]
-            if elnr != startnrs[-1]:
-                if element["register"]:
+                    f.skip()  # Signalbilder-Endmarke
+
+                fstrsig_er_nr = f.next_int()  # TODO
+
+                ET.SubElement(n_signal, "HsigBegriff", {"FahrstrTyp": "1"})
+
+                ET.SubElement(
+                    n_signal,
+                    "HsigBegriff",
+                    {
+                        "HsigGeschw": "-1",
+                        "FahrstrTyp": "1",  # Fahrweg
+                    },
+                )
+                ET.SubElement(n_signal, "VsigBegriff", {"VsigGeschw": "-1"})
+
+                me = ET.SubElement(
+                    n_signal,
+                    "MatrixEintrag",
+                    {
+                        "MatrixGeschw": "-1",
+                        "Signalbild": "3",
+                    },
+                )
+                conv_ereignis(fstrsig_er_nr, me)
+
+                me = ET.SubElement(
+                    n_signal,
+                    "MatrixEintrag",
+                    {
+                        "MatrixGeschw": "-1",
+                        "Signalbild": "5",
+                    },
+                )
+                conv_ereignis(fstrsig_er_nr, me)
+
+                n_signal.attrib["BoundingR"] = None  # wird später gesetzt
+                ls_dateien.extend(sigframe_dateien)
+                signal_sigframes.append((n_signal, sigframe_dateien))
+
+                f.skip()  # Am Signal angekündigte Geschwindigkeit
+                if (fstrsig_koppelsignal_element := f.next_int()) != 0:
                     ET.SubElement(
                         ET.SubElement(
-                            n_fahrstrasse,
-                            "FahrstrRegister",
-                            {"Ref": str(get_ref_nr(elnr, 2))},
+                            n_signal,
+                            "KoppelSignal",
+                            {
+                                "ReferenzNr": str(
+                                    get_ref_nr(
+                                        fstrsig_koppelsignal_element,
+                                        RefTyp.SIGNAL_GEGENRICHTUNG,
+                                    )
+                                )
+                            },
                         ),
                         "Datei",
                         {"Dateiname": outname_rel, "NurInfo": "1"},
                     )
 
-                if element["aufloesepunkt"]:
+            if (x1 := f.next_float()) is not None:
+                # Kombisignal
+                with profil.phase("signale"):
+                    sig = Signal()
+                    n_signal = ET.SubElement(n_norm, "Signal")
+                    sigframe_dateien = []
+
+                    y1 = f.next_float()
+                    z1 = f.next_float()
+                    rx1 = f.next_floatstr()
+                    ry1 = f.next_floatstr()
+                    rz1 = f.next_floatstr()
+
+                    x2 = f.next_float()
+                    y2 = f.next_float()
+                    z2 = f.next_float()
+                    rx2 = f.next_floatstr()
+                    ry2 = f.next_floatstr()
+                    rz2 = f.next_floatstr()
+
+                    if not x1 and not y1 and not z1:
+                        xorigin, yorigin, zorigin = x2, y2, z2
+                    elif not x2 and not y2 and not z2:
+                        xorigin, yorigin, zorigin = x1, y1, z1
+                    else:
+                        xorigin, yorigin, zorigin = (
+                            (x1 + x2) / 2.0,
+                            (y1 + y2) / 2.0,
+                            (z1 + z2) / 2.0,
+                        )
+
                     ET.SubElement(
-                        ET.SubElement(
-                            n_fahrstrasse,
-                            "FahrstrTeilaufloesung",
-                            {"Ref": str(get_ref_nr(elnr, 5))},
-                        ),
-                        "Datei",
-                        {"Dateiname": outname_rel, "NurInfo": "1"},
+                        n_signal,
+                        "p",
+                        {
+                            "X": str(xorigin),
+                            "Y": str(yorigin),
+                            "Z": str(zorigin),
+                        },
                     )
 
-                if elnr in fahrstrsignale:
-                    ET.SubElement(
+                    # Erste .ls-Datei
+                    sigframes = []
+                    while not (lsdatei := f.next_str()).startswith("#"):
+                        sig.anzahl_sigframes += 1
+                        n_signalframe = ET.Element("SignalFrame")
+                        sigframes.append(n_signalframe)
+                        sigframe_dateien.append(lsdatei)
                         ET.SubElement(
-                            n_fahrstrasse,
-                            "FahrstrSignal",
+                            n_signalframe,
+                            "Datei",
                             {
-                                "FahrstrSignalZeile": "1",
-                                "Ref": str(
-                                    get_ref_nr(elnr, RefTyp.SIGNAL_GEGENRICHTUNG)
-                                ),
+                                "Dateiname": landschaft.ls3_name(
+                                    lsdatei, no_displacement=True
+                                )
                             },
-                        ),
-                        "Datei",
-                        {"Dateiname": outname_rel, "NurInfo": "1"},
-                    )
-
-                if elnr in signale:
-                    sig = signale[elnr]
-                    if True:  # if any(mz.vmax == 0 for mz in sig.matrix):
-                        # TODO gibt es diese Unterscheidung auch in Zusi 2?
-                        try:
-                            startsig = signale[startnrs[-1]]
-                        except KeyError:
-                            startsig = None  # Aufgleispunkt
-
-                        # Zielsignal verknüpfen
-                        try:
-                            zeile_v0 = next(
-                                idx for idx, mz in enumerate(sig.matrix) if mz.vmax == 0
+                        )
+                        # Position
+                        if f.next_line().startswith("2"):
+                            ET.SubElement(
+                                n_signalframe,
+                                "p",
+                                {
+                                    "X": str(x2 - xorigin),
+                                    "Y": str(y2 - yorigin),
+                                    "Z": str(z2 - zorigin),
+                                },
                             )
-                        except StopIteration:
-                            print(f"Signal ohne Zeile v=0", file=sys.stderr)
-                            zeile_v0 = 0
-
-                        ET.SubElement(
                             ET.SubElement(
-                                n_fahrstrasse,
-                                "FahrstrSignal",
+                                n_signalframe,
+                                "phi",
                                 {
-                                    "FahrstrSignalZeile": str(zeile_v0),
-                                    "Ref": str(get_ref_nr(elnr, 4)),
+                                    "X": str(rx2),
+                                    "Y": str(ry2),
+                                    "Z": str(rz2),
                                 },
-                            ),
-                            "Datei",
-                            {"Dateiname": outname_rel, "NurInfo": "1"},
+                            )
+                        else:
+                            ET.SubElement(
+                                n_signalframe,
+                                "p",
+                                {
+                                    "X": str(x1 - xorigin),
+                                    "Y": str(y1 - yorigin),
+                                    "Z": str(z1 - zorigin),
+                                },
+                            )
+                            ET.SubElement(
+                                n_signalframe,
+                                "phi",
+                                {
+                                    "X": str(rx1),
+                                    "Y": str(ry1),
+                                    "Z": str(rz1),
+                                },
+                            )
+
+                    sig.elnr = elem_nr
+                    sig.block = f.next_str()
+                    sig.gleis = f.next_str()
+
+                    numzeilen = f.next_int() + 1
+                    numspalten = f.next_int() + 1
+
+                    sig.matrix = []
+
+                    seen_blocks = set()
+                    for i in range(0, numzeilen):
+                        # Fahrziel-Block, Fahrziel-Gleis, vmax, #, #
+                        mz = MatrixZeile()
+                        mz.block = f.next_str()
+                        mz.gleis = f.next_str()
+                        if mz.block or mz.gleis:
+                            assert f"{mz.block} {mz.gleis}" not in seen_blocks
+                            seen_blocks.add(f"{mz.block} {mz.gleis}")
+                        mz.vmax = f.next_int()
+                        sig.matrix.append(mz)
+                        f.skip()
+                        f.skip()
+
+                        if True:  # mz.vmax == 0 or mz.block or mz.gleis:
+                            n_hsig_begriff = ET.SubElement(
+                                n_signal,
+                                "HsigBegriff",
+                                {
+                                    "FahrstrTyp": "6",
+                                    "HsigGeschw": "0"
+                                    if mz.vmax == 0
+                                    else str(mz.vmax / 3.6),
+                                },
+                            )
+
+                    # if any(mz.vmax == 0 for mz in sig.matrix):
+                    #    ET.SubElement(n_norm, "Ereignis", {"Er":"29", "Beschr": f"{sig.block} {sig.gleis}"})
+
+                    for i in range(0, numspalten):
+                        vsig_geschw = f.next_int()
+                        sig.vsig_geschw.append(vsig_geschw)
+                        n_vsig_begriff = ET.SubElement(
+                            n_signal,
+                            "VsigBegriff",
+                            {
+                                "VsigGeschw": "-1"
+                                if vsig_geschw == -1
+                                else str(vsig_geschw / 3.6),
+                            },
                         )
 
-                        # Startsignal und Vorsignale verknüpfen
-                        if startsig is not None:
-                            for idx, mz in enumerate(startsig.matrix):
-                                if mz.block != sig.block or mz.gleis != sig.gleis:
-                                    continue
-
-                                ET.SubElement(
-                                    ET.SubElement(
-                                        n_fahrstrasse,
-                                        "FahrstrSignal",
-                                        {
-                                            "FahrstrSignalZeile": str(idx),
-                                            "Ref": str(get_ref_nr(startnrs[-1], 4)),
-                                        },
-                                    ),
-                                    "Datei",
-                                    {"Dateiname": outname_rel, "NurInfo": "1"},
+                    # Aus bei Hp0
+                    f.skip()
+
+                    for i in range(0, numzeilen):
+                        mz = sig.matrix[i]
+                        for j in range(0, numspalten):
+                            me = MatrixEintrag()
+                            me.bild = f.next_int()
+                            me.vmax = f.next_int()
+                            if me.vmax == 0 and sig.matrix[i].vmax != 0:
+                                protokoll.warnung(
+                                    "Matrixeinträge mit v=0 in Zeilen mit v!=0",
+                                    "Element %s, Zeile %s, Spalte %s: v=0, aber Zeile v!=0",
+                                    elem_nr,
+                                    i,
+                                    j,
+                                )
+                            me.id = f.next_int()
+                            me.er1 = f.next_int()
+                            me.er2 = f.next_int()
+                            f.skip()
+
+                            sig.matrix[i].spalten.append(me)
+
+                            if True:  # mz.vmax == 0 or mz.block or mz.gleis:
+                                n_me = ET.SubElement(
+                                    n_signal,
+                                    "MatrixEintrag",
+                                    {
+                                        "MatrixGeschw": "-1"
+                                        if me.vmax == -1
+                                        else str(me.vmax / 3.6),
+                                        "Signalbild": str(me.bild),
+                                    },
                                 )
 
-                                # signalisierte Geschwindigkeit
-                                hsig_geschw = None
-                                ID = 0
-                                for spalte, vsig_geschw in enumerate(
-                                    startsig.vsig_geschw
-                                ):
-                                    if vsig_geschw == 0:
-                                        hsig_geschw = (
-                                            startsig.matrix[idx].spalten[spalte].vmax
-                                        )
-                                        ID = startsig.matrix[idx].spalten[spalte].id
-                                        break
-                                else:
-                                    hsig_geschw = startsig.matrix[idx].spalten[0].vmax
-                                    ID = startsig.matrix[idx].spalten[0].id
-
-                                for vsig_nr in startsig.vsigs:
-                                    try:
-                                        vsig = signale[vsig_nr]
-                                    except KeyError:
-                                        try:
-                                            vsig = anonymesignale[vsig_nr]
-                                        except KeyError:
-                                            print(
-                                                f"Kein Vorsignal an Element {vsig_nr}"
-                                            )
-                                            continue
-
-                                    ET.SubElement(
-                                        ET.SubElement(
-                                            n_fahrstrasse,
-                                            "FahrstrVSignal",
-                                            {
-                                                "FahrstrSignalSpalte": str(
-                                                    get_vsig_spalte(
-                                                        vsig, hsig_geschw, ID
-                                                    )
-                                                ),
-                                                "Ref": str(get_ref_nr(vsig_nr, 4)),
-                                            },
-                                        ),
-                                        "Datei",
-                                        {"Dateiname": outname_rel, "NurInfo": "1"},
-                                    )
-                                if hsig_geschw == 0:
-                                    print(
-                                        f" -> {sig.block} {sig.gleis}: vmax == 0 -> weiter",
-                                        file=sys.stderr,
-                                    )
-                                    get_fahrstr_rek(
-                                        startnrs + [elnr], elnr, n_fahrstrasse
-                                    )
-                                    return
+                    ersatz_bild = f.next_int()
+                    ersatz_vmax = f.next_int()
+                    ersatz_id = f.next_int()
+                    ersatz_er1 = f.next_int()
+                    ersatz_er2 = f.next_int()
+                    ersatz_reserviert = f.next_line()
+                    f.skip()  # Wahrsch. Ersatzsignal
+
+                    while not (vsig := f.next_line()).startswith("#"):
+                        sig.vsigs.append(int(vsig))
+                    sig.index_aufbauen()
+
+                    f.skip()  # reserviert
+
+                    if sig.block != "" and sig.gleis != "":
+                        n_signal.attrib["NameBetriebsstelle"] = sig.block
+                        n_signal.attrib["Stellwerk"] = sig.block
+                        n_signal.attrib["Signalname"] = sig.gleis
+                        signale[elem_nr] = sig
+                        flags |= gleisgraph.SIGNAL
+                    else:
+                        n_signal.attrib["Signalname"] = f"Element {elem_nr}"
+                        anonymesignale[elem_nr] = sig
+
+                    for sigframe in sigframes:
+                        n_signal.append(sigframe)
+
+                    n_signal.attrib["BoundingR"] = None  # wird später gesetzt
+                    ls_dateien.extend(sigframe_dateien)
+                    signal_sigframes.append((n_signal, sigframe_dateien))
+
+                    allocate_refpunkt(n_strecke, elem_nr, RefTyp.SIGNAL)
+
+            register = f.next_int()
+
+            if er_nr == 3002:
+                flags |= gleisgraph.AUFLOESEPUNKT
+                allocate_refpunkt(n_strecke, elem_nr, RefTyp.AUFLOESEPUNKT)
+
+                if register == 0:
+                    protokoll.warnung(
+                        "Auflöseelemente ohne Register",
+                        "kein Register an Auflöseelement %s, erfinde eins",
+                        elem_nr,
+                    )
+                    register = regnr
+                    regnr += 1
 
-                                break
-                            else:
-                                print(
-                                    f"{startnrs[-1]}: keine zeile für Fahrweg nach {elnr} ({sig.block} {sig.gleis}) gefunden",
-                                    file=sys.stderr,
-                                )
-                                return
+            if register != 0:
+                flags |= gleisgraph.REGISTER
+                n_norm.attrib["Reg"] = str(register)
+                allocate_refpunkt(n_strecke, elem_nr, RefTyp.REGISTER)
 
-                        ET.SubElement(
-                            ET.SubElement(
-                                n_fahrstrasse,
-                                "FahrstrZiel",
-                                {"Ref": str(get_ref_nr(elnr, 4))},
-                            ),
-                            "Datei",
-                            {"Dateiname": outname_rel, "NurInfo": "1"},
-                        )
-                        fname = ""
-                        for startnr in startnrs:
-                            try:
-                                startsig = signale[startnr]
-                                fname += f"{startsig.block} {startsig.gleis} -> "
-                            except KeyError:
-                                fname += f"Aufgleispunkt -> "
-                        fname += f"{sig.block} {sig.gleis}"
-                        n_fahrstrasse.attrib["FahrstrName"] = fname
-
-                        get_aufloesepunkte_rek(elnr, elnr, n_fahrstrasse)
-
-                        n_fahrstrasse.attrib["FahrstrTyp"] = f"TypZug"
-                        n_strecke.append(n_fahrstrasse)
-                        print(f" -> {fname}", file=sys.stderr)
-                        break
+            graph.add(elem_nr, succ, flags)
 
-            succs = element["succ"]
-            for idx, succ in enumerate(succs):
-                if len(succs) == 1:
-                    n_fahrstrasse2 = n_fahrstrasse
-                else:
-                    n_fahrstrasse2 = copy.deepcopy(n_fahrstrasse)
+            writer.flush(verzoegert=len(signal_sigframes) != anzahl_signale)
 
-                succ_preds = elements[succ]["pred"]
-                if len(succ_preds) > 1:
-                    ET.SubElement(
-                        ET.SubElement(
-                            n_fahrstrasse2,
-                            "FahrstrWeiche",
-                            {
-                                "FahrstrWeichenlage": str(succ_preds.index(elnr) + 1),
-                                "Ref": str(
-                                    get_ref_nr(succ, RefTyp.WEICHE_GEGENRICHTUNG)
-                                ),
-                            },
-                        ),
-                        "Datei",
-                        {"Dateiname": outname_rel, "NurInfo": "1"},
-                    )
+        f.close()
 
-                if len(succs) == 1:
-                    elnr = succs[0]
-                    break
-                else:
-                    ET.SubElement(
-                        ET.SubElement(
-                            n_fahrstrasse2,
-                            "FahrstrWeiche",
-                            {
-                                "FahrstrWeichenlage": str(idx + 1),
-                                "Ref": str(get_ref_nr(elnr, 3)),
-                            },
-                        ),
-                        "Datei",
-                        {"Dateiname": outname_rel, "NurInfo": "1"},
-                    )
-                    get_fahrstr_rek(startnrs, succ, n_fahrstrasse2)
-            else:
-                break
+    with profil.phase("nachgegen"):
+        for i in graph.finish():
+            allocate_refpunkt(n_strecke, graph.nr[i], RefTyp.WEICHE_GEGENRICHTUNG)
+
+    with profil.phase("kreise"):
+        for kreis in graph.kreise():
+            protokoll.warnung(
+                "Gleiskreise ohne Hauptsignal",
+                "Gleiskreis ohne Hauptsignal, Fahrstraßen darüber werden verworfen: "
+                "Elemente %s",
+                ", ".join(str(graph.nr[i]) for i in kreis),
+            )
 
+    suche = Fahrstrassensuche(graph, signale, anonymesignale, grenzen)
+
+    starts = []
     for elnr, sig in signale.items():
-        if any(mz.vmax == 0 for mz in sig.matrix):
+        if sig.zeile_v0 is not None:
             # Hsig
-            print(f"{sig.block} {sig.gleis}", file=sys.stderr)
-            n_fahrstrasse = ET.Element("Fahrstrasse")
-            ET.SubElement(
-                ET.SubElement(
-                    n_fahrstrasse, "FahrstrStart", {"Ref": str(get_ref_nr(elnr, 4))}
-                ),
-                "Datei",
-                {"Dateiname": outname_rel, "NurInfo": "1"},
-            )
-            get_fahrstr_rek([elnr], elnr, n_fahrstrasse)
+            starts.append((elnr, RefTyp.SIGNAL, f"{sig.block} {sig.gleis}"))
 
     for elnr in aufgleispunkte.values():
-        print(f"Aufgleispunkt {elnr}", file=sys.stderr)
-        n_fahrstrasse = ET.Element("Fahrstrasse")
-        ET.SubElement(
-            ET.SubElement(
-                n_fahrstrasse,
-                "FahrstrStart",
-                {"Ref": str(get_ref_nr(elnr, RefTyp.AUFGLEISPUNKT))},
-            ),
-            "Datei",
-            {"Dateiname": outname_rel, "NurInfo": "1"},
-        )
-        get_fahrstr_rek([elnr], elnr, n_fahrstrasse)
+        starts.append((elnr, RefTyp.AUFGLEISPUNKT, f"Aufgleispunkt {elnr}"))
 
     outname_abs = common.z3rel_to_abs(outname_rel)
-    print(f"writing {outname_abs}", file=sys.stderr)
     os.makedirs(os.path.dirname(outname_abs), exist_ok=True)
-    tree.write(outname_abs, encoding="unicode")
-    print(f"done", file=sys.stderr)
+    # Mit jobs > 1 werden die Signalframes konvertiert, während die Worker
+    # schon Fahrstraßen suchen. Die Signale werden erst geschrieben, wenn ihr
+    # BoundingR feststeht, die Fahrstraßen danach.
+    #
+    # Dafür teilen sich beide die jobs Prozesse, damit -j eine Obergrenze
+    # bleibt: ls_jobs für die ls-Dateien (bei 1 der Hauptprozess selbst), der
+    # Rest für die Suche.
+    if jobs > 1 and len(starts) > 1:
+        ls_jobs = max(1, jobs // 2)
+        such_worker = jobs - ls_jobs
+    else:
+        ls_jobs = jobs
+        such_worker = 0
+    with fahrstrassen_parallel(suche, starts, such_worker) as fahrstrassen:
+        with profil.phase("landschaft"):
+            verknuepfungen = landschaft.conv_ls_parallel(
+                [(datei, True) for datei in ls_dateien], ls_jobs
+            )
+            for n_signal, sigframe_dateien in signal_sigframes:
+                boundingr = 0
+                for datei in sigframe_dateien:
+                    boundingr = max(boundingr, verknuepfungen[(datei, True)].boundingr)
+                n_signal.attrib["BoundingR"] = str(int(math.ceil(boundingr)))
+
+        # Die Fahrstraßen werden während des Schreibens gesucht bzw. von den
+        # Workern abgeholt, das wird als eigene Phase innerhalb von "schreiben"
+        # gemessen.
+        protokoll.info("writing %s", outname_abs)
+        with profil.phase("schreiben"):
+            xml = FahrstrassenXml(outname_rel)
+            writer.write(outname_abs, graph, map(xml, fahrstrassen))
+    manifest.ausgabe(outname_abs)
+
+    _schnappschuss_speichern(
+        strname,
+        Schnappschuss(
+            outname_rel,
+            rekursionstiefe,
+            aufgleispunkte,
+            {
+                (sig.block, sig.gleis)
+                for sig in signale.values()
+                if sig.zeile_v0 is not None
+            },
+            xml.namen,
+            tuple(grenzen),
+        ),
+    )
+    protokoll.info("done")
 
     return (outname_rel, rekursionstiefe)